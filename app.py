@@ -508,7 +508,7 @@ def render_export_tab():
                  disabled=not (result.inbound_shipments or result.outbound_shipments)):
         
         with st.spinner("Generating Excel file..."):
-            excel_bytes = pipeline.generate_excel(declaration_period)
+            excel_file = pipeline.generate_excel(declaration_period)
         
         st.success("✅ Excel file generated!")
         
@@ -516,7 +516,7 @@ def render_export_tab():
         
         st.download_button(
             label="📥 Download Declaration Excel",
-            data=excel_bytes,
+            data=excel_file,
             file_name=filename,
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
@@ -18,6 +18,7 @@ Design Decisions:
 from dataclasses import dataclass, field
 from typing import List, Dict, Tuple, Optional, Set
 from enum import Enum
+import functools
 import re
 import logging
 
@@ -324,6 +325,7 @@ class ProductClassifier:
     def add_brand(self, brand: str, category: ProductCategory):
         """Add a new brand -> category mapping"""
         self.brand_categories[brand.lower()] = category
+        classify_description.cache_clear()
         logger.info(f"Added brand mapping: {brand} -> {category.value}")
     
     def add_keyword_pattern(self, category: ProductCategory, pattern: str):
@@ -331,6 +333,7 @@ class ProductClassifier:
         if category not in self.keyword_patterns:
             self.keyword_patterns[category] = []
         self.keyword_patterns[category].append(pattern)
+        classify_description.cache_clear()
         logger.info(f"Added keyword pattern: {pattern} -> {category.value}")
 
 
@@ -345,10 +348,14 @@ def get_classifier() -> ProductClassifier:
     return _classifier_instance
 
 
+@functools.lru_cache(maxsize=4096)
 def classify_description(description: str) -> str:
     """
     Convenience function to classify a description and return display string.
     
+    Results are memoized per description (the same AWB labels recur across
+    rows); add_brand/add_keyword_pattern clear the cache.
+    
     Args:
         description: Product description text
         
@@ -70,6 +70,14 @@ class TransportModeConfig:
         },
     }
     
+    # (keyword, mode) pairs flattened once from REGISTRY, in registry order
+    # so earlier modes keep priority in detect_mode
+    _KEYWORD_MODES = tuple(
+        (keyword, mode)
+        for mode, config in REGISTRY.items()
+        for keyword in config['keywords']
+    )
+    
     @classmethod
     def detect_mode(cls, text: str) -> Optional[str]:
         """
@@ -78,10 +86,9 @@ class TransportModeConfig:
         Returns mode name if detected, None otherwise.
         """
         text_lower = text.lower()
-        for mode, config in cls.REGISTRY.items():
-            for keyword in config['keywords']:
-                if keyword in text_lower:
-                    return mode
+        for keyword, mode in cls._KEYWORD_MODES:
+            if keyword in text_lower:
+                return mode
         return None
     
     @classmethod
@@ -105,16 +112,29 @@ class APISettings:
     max_retries: int = 3
     timeout_seconds: int = 60
     max_tokens: int = 2000
+    max_concurrency: int = 3  # Parallel in-flight requests (spacing still set by delay_seconds)
+    pages_per_request: int = 1  # >1 sends several inbound pages per request (prompts are tuned per page)
+    requests_per_minute: int = 0  # >0 (or tokens_per_minute >0) switches to token-bucket limiting
+    tokens_per_minute: int = 0  # Input-token budget; 0 = unlimited
 
 
 @dataclass  
 class ProcessingSettings:
     """Document processing configuration"""
     pdf_zoom_factor: float = 2.0  # Higher = better quality but slower
+    render_workers: int = 1  # >1 rasterizes pages in that many worker processes
     max_pages_per_document: int = 50  # Safety limit
+    progress_interval_seconds: float = 0.1  # Minimum gap between UI progress callbacks
     supported_image_formats: tuple = ("png", "jpg", "jpeg")
     
 
+@dataclass
+class CacheSettings:
+    """In-memory cache limits"""
+    max_sap_entries: int = 32  # Parsed SAP workbooks kept (LRU, keyed by file content)
+    max_audit_entries: Optional[int] = None  # Ring-buffer the audit trail; None = keep all
+
+
 @dataclass
 class ValidationSettings:
     """Data validation thresholds"""
@@ -223,6 +243,7 @@ class Settings:
     """
     api: APISettings = field(default_factory=APISettings)
     processing: ProcessingSettings = field(default_factory=ProcessingSettings)
+    cache: CacheSettings = field(default_factory=CacheSettings)
     validation: ValidationSettings = field(default_factory=ValidationSettings)
     mappings: MappingSettings = field(default_factory=MappingSettings)
     output: OutputSettings = field(default_factory=OutputSettings)
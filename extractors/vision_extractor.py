@@ -8,7 +8,7 @@ Responsible for:
 
 Design Decisions:
 1. Single responsibility: just does extraction, doesn't aggregate
-2. Rate limiting handled externally by RateLimiter
+2. Rate limiting handled externally (RateLimiter or TokenBucketRateLimiter)
 3. All prompts loaded from external files for easy tuning
 4. Raw responses stored for debugging
 """
@@ -17,10 +17,15 @@ import fitz  # PyMuPDF
 import base64
 import json
 import re
+import time
 import logging
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import date
-from typing import Optional, List, Dict, Any, BinaryIO
+from typing import Optional, List, Dict, Any, BinaryIO, Callable, Union
 
 import anthropic
 
@@ -29,29 +34,104 @@ from models.shipment import (
     ExtractionConfidence, parse_date_flexible
 )
 from config.settings import Settings
-from utils.helpers import RateLimiter, normalize_tracking_number, normalize_awb_number
+from utils.helpers import (
+    RateLimiter, TokenBucketRateLimiter, create_rate_limiter,
+    normalize_tracking_number, normalize_awb_number
+)
 
 logger = logging.getLogger(__name__)
 
 
+# Appended to the regular prompt when several pages share one request
+BATCH_PROMPT_SUFFIX = """
+
+MULTIPLE PAGES: The {count} images above are separate pages, each preceded by its page label.
+Apply the instructions above to EACH page independently.
+Respond with a JSON array of exactly {count} objects (one per page, in the same order) and nothing else."""
+
+# Response parsing
+_JSON_ARRAY = re.compile(r'\[[\s\S]*\]')
+_JSON_OBJECT = re.compile(r'\{[\s\S]*\}')
+_FLIGHT_NUMBER = re.compile(r'[A-Z]{2}\d{3,4}')
+_NON_NUMERIC = re.compile(r'[^\d.]')
+_BRAND_CODE = re.compile(r'\s*([A-Za-z]{3})\s*')  # 3-letter code, surrounding whitespace allowed
+
+# Rough input-token costs for the tokens/minute bucket (an image is resized
+# to at most ~1.15 megapixels, i.e. ~1600 tokens; text is ~4 chars/token)
+IMAGE_TOKEN_ESTIMATE = 1600
+CHARS_PER_TOKEN = 4
+
+# MuPDF is not thread-safe: every in-process open/render goes through this
+# lock, whichever thread calls it (worker processes get their own copy)
+_MUPDF_LOCK = threading.Lock()
+
+
 class VisionExtractorError(Exception):
     """Custom exception for extraction errors"""
     pass
 
 
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Seconds from a 429 response's Retry-After header, if present"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return max(0.0, float(response.headers.get('retry-after')))
+    except (TypeError, ValueError):
+        return None
+
+
+# Statuses worth retrying, as in the SDK's own retry policy (408 timeout,
+# 409 lock, 429 rate limit); any 5xx, including 529 overloaded, also qualifies
+_RETRYABLE_STATUSES = frozenset({408, 409, 429})
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether a failed API call is worth another attempt"""
+    if isinstance(error, anthropic.APIConnectionError):  # Includes APITimeoutError
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in _RETRYABLE_STATUSES or error.status_code >= 500
+    return False
+
+
+def _render_pages(pdf_path: str, page_nums: List[int], zoom_factor: float) -> List[str]:
+    """
+    Render pages of one PDF to base64 PNG, opening the document once.
+    
+    Module-level so it can also run in a worker process.
+    """
+    with _MUPDF_LOCK:
+        doc = fitz.open(pdf_path)
+        try:
+            mat = fitz.Matrix(zoom_factor, zoom_factor)
+            pages = []
+            for page_num in page_nums:
+                if page_num >= len(doc):
+                    raise ValueError(f"Page {page_num} does not exist (max: {len(doc)-1})")
+                pix = doc[page_num].get_pixmap(matrix=mat)
+                pages.append(base64.standard_b64encode(pix.tobytes("png")).decode('utf-8'))
+            return pages
+        finally:
+            doc.close()
+
+
 class PDFProcessor:
     """
     Converts PDF pages to base64 images for Vision API.
     """
     
-    def __init__(self, zoom_factor: float = 2.0):
+    def __init__(self, zoom_factor: float = 2.0, render_workers: int = 1):
         self.zoom_factor = zoom_factor
+        self.render_workers = render_workers
     
     def get_page_count(self, pdf_path: str) -> int:
         """Get the number of pages in a PDF"""
-        doc = fitz.open(pdf_path)
-        count = len(doc)
-        doc.close()
+        with _MUPDF_LOCK:
+            doc = fitz.open(pdf_path)
+            count = len(doc)
+            doc.close()
         return count
     
     def page_to_base64(self, pdf_path: str, page_num: int) -> str:
@@ -65,19 +145,37 @@ class PDFProcessor:
         Returns:
             Base64 encoded PNG string
         """
-        doc = fitz.open(pdf_path)
-        
-        if page_num >= len(doc):
-            doc.close()
-            raise ValueError(f"Page {page_num} does not exist (max: {len(doc)-1})")
+        return _render_pages(pdf_path, [page_num], self.zoom_factor)[0]
+    
+    def pages_to_base64(self, pdf_path: str, page_nums: List[int]) -> List[str]:
+        """
+        Convert several pages of one PDF to base64 PNGs.
         
-        page = doc[page_num]
-        mat = fitz.Matrix(self.zoom_factor, self.zoom_factor)
-        pix = page.get_pixmap(matrix=mat)
-        img_bytes = pix.tobytes("png")
-        doc.close()
+        Rendering is CPU-bound and MuPDF is not thread-safe, so with
+        render_workers > 1 the pages are split across worker processes.
         
-        return base64.standard_b64encode(img_bytes).decode('utf-8')
+        Args:
+            pdf_path: Path to PDF file
+            page_nums: 0-indexed page numbers
+            
+        Returns:
+            Base64 encoded PNG strings, in page_nums order
+        """
+        workers = min(self.render_workers, len(page_nums))
+        if workers <= 1:
+            return _render_pages(pdf_path, page_nums, self.zoom_factor)
+        
+        chunks = [page_nums[i::workers] for i in range(workers)]
+        # spawn: forking a threaded process (Streamlit) is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            rendered = list(pool.map(
+                _render_pages, [pdf_path] * workers, chunks, [self.zoom_factor] * workers
+            ))
+        
+        images: Dict[int, str] = {}
+        for chunk, chunk_images in zip(chunks, rendered):
+            images.update(zip(chunk, chunk_images))
+        return [images[n] for n in page_nums]
     
     def all_pages_to_base64(self, pdf_path: str, max_pages: int = 50) -> List[str]:
         """
@@ -90,18 +188,8 @@ class PDFProcessor:
         Returns:
             List of base64 encoded PNG strings
         """
-        doc = fitz.open(pdf_path)
-        pages = []
-        
-        for i in range(min(len(doc), max_pages)):
-            page = doc[i]
-            mat = fitz.Matrix(self.zoom_factor, self.zoom_factor)
-            pix = page.get_pixmap(matrix=mat)
-            img_bytes = pix.tobytes("png")
-            pages.append(base64.standard_b64encode(img_bytes).decode('utf-8'))
-        
-        doc.close()
-        return pages
+        page_count = self.get_page_count(pdf_path)
+        return self.pages_to_base64(pdf_path, list(range(min(page_count, max_pages))))
 
 
 class VisionExtractor:
@@ -113,9 +201,13 @@ class VisionExtractor:
         result = extractor.extract_from_image(base64_image, "inbound")
     """
     
-    def __init__(self, settings: Settings, rate_limiter: Optional[RateLimiter] = None):
+    def __init__(
+        self,
+        settings: Settings,
+        rate_limiter: Optional[Union[RateLimiter, TokenBucketRateLimiter]] = None
+    ):
         self.settings = settings
-        self.rate_limiter = rate_limiter or RateLimiter(settings.api.delay_seconds)
+        self.rate_limiter = rate_limiter or create_rate_limiter(settings.api)
         self._client: Optional[anthropic.Anthropic] = None
         self._prompts: Dict[str, str] = {}
         self._load_prompts()
@@ -147,6 +239,11 @@ class VisionExtractor:
         else:
             logger.warning(f"Outbound invoice prompt not found at {outbound_invoice_path}")
             self._prompts['outbound_invoice'] = self._get_default_outbound_invoice_prompt()
+        
+        # Prebuilt text blocks, reused for every request of that type
+        self._prompt_blocks: Dict[str, Dict[str, str]] = {
+            name: {"type": "text", "text": prompt} for name, prompt in self._prompts.items()
+        }
     
     def _get_default_inbound_prompt(self) -> str:
         """Fallback prompt if file not found"""
@@ -174,9 +271,78 @@ class VisionExtractor:
         if self._client is None:
             if not self.settings.api.api_key:
                 raise VisionExtractorError("API key not configured")
-            self._client = anthropic.Anthropic(api_key=self.settings.api.api_key)
+            # SDK retries disabled: _send owns the retry policy (same retryable
+            # errors) so every attempt goes through the shared rate limiter
+            self._client = anthropic.Anthropic(api_key=self.settings.api.api_key, max_retries=0)
         return self._client
     
+    @staticmethod
+    def _image_block(base64_image: str) -> Dict[str, Any]:
+        """Build an image content block for the Messages API"""
+        return {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": "image/png",
+                "data": base64_image
+            }
+        }
+    
+    def _send(self, content: List[Dict[str, Any]], max_tokens: int, page_number: int) -> str:
+        """
+        Send a single user message and return the response text.
+        
+        Applies the rate limiter before every attempt and retries rate
+        limits, timeouts, connection drops and 5xx/overloaded errors with
+        exponential backoff (or the server's Retry-After, which also
+        pauses the shared limiter).
+        """
+        max_retries = self.settings.api.max_retries
+        
+        # Only the token bucket takes a per-request cost
+        wait_args = ()
+        if isinstance(self.rate_limiter, TokenBucketRateLimiter):
+            wait_args = (sum(
+                IMAGE_TOKEN_ESTIMATE if block['type'] == 'image'
+                else len(block.get('text', '')) // CHARS_PER_TOKEN
+                for block in content
+            ),)
+        
+        for attempt in range(max_retries + 1):
+            # Rate limit
+            self.rate_limiter.wait(*wait_args)
+            
+            try:
+                response = self.client.messages.create(
+                    model=self.settings.api.model,
+                    max_tokens=max_tokens,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": content
+                        }
+                    ]
+                )
+            except anthropic.APIError as e:
+                if not _is_retryable(e) or attempt >= max_retries:
+                    raise
+                retry_after = _retry_after_seconds(e)
+                if retry_after is not None:
+                    # Hold every worker back, not just this one
+                    self.rate_limiter.pause(retry_after)
+                    backoff = retry_after
+                else:
+                    # Exponential backoff on top of the regular rate limit delay
+                    backoff = self.settings.api.delay_seconds * (2 ** attempt)
+                    time.sleep(backoff)
+                logger.warning(
+                    "Retrying page %s in %ss (attempt %s/%s): %s",
+                    page_number, backoff, attempt + 1, max_retries, e
+                )
+                continue
+            
+            return response.content[0].text
+    
     def extract_from_image(
         self, 
         base64_image: str, 
@@ -194,37 +360,34 @@ class VisionExtractor:
         Returns:
             ExtractionResult with extracted data
         """
-        # Rate limit
-        self.rate_limiter.wait()
-        
-        prompt = self._prompts.get(prompt_type, self._prompts.get('inbound'))
+        return self.specialize(prompt_type)(base64_image, page_number)
+    
+    def specialize(self, prompt_type: str) -> Callable[..., ExtractionResult]:
+        """
+        Bind a prompt type once for a processing stage.
         
+        Returns extract(base64_image, page_number=0) with the prompt
+        block and response parser already resolved. Unknown types fall
+        back to the inbound prompt and parser.
+        """
+        if prompt_type not in self._prompt_blocks:
+            prompt_type = 'inbound'
+        return functools.partial(self._extract_page, self._prompt_blocks[prompt_type], prompt_type)
+    
+    def _extract_page(
+        self,
+        prompt_block: Dict[str, str],
+        prompt_type: str,
+        base64_image: str,
+        page_number: int = 0
+    ) -> ExtractionResult:
+        """Single-image extraction behind extract_from_image()/specialize()"""
         try:
-            response = self.client.messages.create(
-                model=self.settings.api.model,
-                max_tokens=self.settings.api.max_tokens,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "image/png",
-                                    "data": base64_image
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
-                            }
-                        ]
-                    }
-                ]
+            raw_response = self._send(
+                [self._image_block(base64_image), prompt_block],
+                self.settings.api.max_tokens,
+                page_number
             )
-            
-            raw_response = response.content[0].text
             return self._parse_response(raw_response, page_number, prompt_type)
             
         except anthropic.RateLimitError as e:
@@ -246,6 +409,101 @@ class VisionExtractor:
                 extraction_errors=[str(e)]
             )
     
+    def extract_from_images_batch(
+        self,
+        base64_images: List[str],
+        prompt_type: str = "inbound",
+        page_numbers: Optional[List[int]] = None
+    ) -> List[ExtractionResult]:
+        """
+        Extract data from several page images in a single API request.
+        
+        The model is asked for a JSON array with one object per image.
+        If the request is rejected (e.g. too large) the batch is split in
+        half; if the reply can't be matched to the pages, each page is
+        extracted on its own.
+        
+        Returns:
+            One ExtractionResult per image, in input order
+        """
+        if page_numbers is None:
+            page_numbers = list(range(len(base64_images)))
+        
+        extract = self.specialize(prompt_type)
+        if len(base64_images) <= 1:
+            return [extract(img, num) for img, num in zip(base64_images, page_numbers)]
+        
+        prompt = self._prompts.get(prompt_type, self._prompts.get('inbound'))
+        content = []
+        for img, num in zip(base64_images, page_numbers):
+            content.append({"type": "text", "text": f"Page {num}:"})
+            content.append(self._image_block(img))
+        content.append({
+            "type": "text",
+            "text": prompt + BATCH_PROMPT_SUFFIX.format(count=len(base64_images))
+        })
+        
+        try:
+            raw_response = self._send(
+                content,
+                self.settings.api.max_tokens * len(base64_images),
+                page_numbers[0]
+            )
+        except anthropic.BadRequestError as e:
+            logger.warning("Batch of %s pages rejected, splitting: %s", len(base64_images), e)
+            mid = len(base64_images) // 2
+            return (
+                self.extract_from_images_batch(base64_images[:mid], prompt_type, page_numbers[:mid]) +
+                self.extract_from_images_batch(base64_images[mid:], prompt_type, page_numbers[mid:])
+            )
+        except Exception as e:
+            logger.error(f"Batch extraction failed: {e}")
+            error = f"Rate limit exceeded: {e}" if isinstance(e, anthropic.RateLimitError) else str(e)
+            return [
+                ExtractionResult(
+                    document_type=DocumentType.UNKNOWN,
+                    confidence=ExtractionConfidence.LOW,
+                    page_number=num,
+                    raw_response="",
+                    extraction_errors=[error]
+                )
+                for num in page_numbers
+            ]
+        
+        items = self._parse_batch_response(raw_response, len(base64_images))
+        if items is None:
+            logger.warning(
+                "Batch response did not contain %s results, extracting pages individually",
+                len(base64_images)
+            )
+            return [extract(img, num) for img, num in zip(base64_images, page_numbers)]
+        
+        results = []
+        for item, img, num in zip(items, base64_images, page_numbers):
+            try:
+                results.append(self._parse_data(item, raw_response, num, prompt_type))
+            except Exception as e:
+                # One bad entry shouldn't fail the whole file; redo just that page
+                logger.warning("Batch result for page %s unusable, extracting it individually: %s", num, e)
+                results.append(extract(img, num))
+        return results
+    
+    @staticmethod
+    def _parse_batch_response(raw_response: str, expected: int) -> Optional[List[dict]]:
+        """Extract the per-page JSON objects from a batch reply (None if unusable)"""
+        array_match = _JSON_ARRAY.search(raw_response)
+        if not array_match:
+            return None
+        try:
+            items = json.loads(array_match.group())
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(items, list) or len(items) != expected:
+            return None
+        if not all(isinstance(item, dict) for item in items):
+            return None
+        return items
+    
     def _parse_response(self, raw_response: str, page_number: int, prompt_type: str = "inbound") -> ExtractionResult:
         """
         Parse Claude's response into ExtractionResult.
@@ -255,10 +513,8 @@ class VisionExtractor:
         - outbound_awb: AWB-specific fields (flight_info, flight_date, awb_number)
         - outbound_invoice: Invoice-specific fields (invoice_number, date, etc.)
         """
-        errors = []
-        
         # Extract JSON from response
-        json_match = re.search(r'\{[\s\S]*\}', raw_response)
+        json_match = _JSON_OBJECT.search(raw_response)
         if not json_match:
             return ExtractionResult(
                 document_type=DocumentType.UNKNOWN,
@@ -279,6 +535,12 @@ class VisionExtractor:
                 extraction_errors=[f"JSON parse error: {e}"]
             )
         
+        return self._parse_data(data, raw_response, page_number, prompt_type)
+    
+    def _parse_data(self, data: dict, raw_response: str, page_number: int, prompt_type: str) -> ExtractionResult:
+        """Build an ExtractionResult from an already-decoded JSON object"""
+        errors = []
+        
         # Parse confidence (common to all types)
         conf_str = data.get('confidence', 'MEDIUM')
         try:
@@ -332,12 +594,12 @@ class VisionExtractor:
             # Handle comma-separated string
             brand_codes = [b.strip().upper() for b in brand_codes.split(',') if b.strip()]
         elif isinstance(brand_codes, list):
-            # Validate and normalize - only accept 3-letter codes
-            valid_codes = []
-            for code in brand_codes:
-                if isinstance(code, str) and len(code.strip()) == 3 and code.strip().isalpha():
-                    valid_codes.append(code.strip().upper())
-            brand_codes = list(set(valid_codes))  # Deduplicate
+            # Validate and normalize - only accept 3-letter codes (deduplicated)
+            brand_codes = list({
+                match.group(1).upper()
+                for code in brand_codes
+                if isinstance(code, str) and (match := _BRAND_CODE.fullmatch(code))
+            })
         else:
             brand_codes = []
         
@@ -389,7 +651,7 @@ class VisionExtractor:
         if flight_number:
             # Extract flight numbers from formats like "VN654", "SQ914/09-Sep" or "SQ914 / VN654"
             # Match patterns like SQ914, VN654, etc.
-            flight_matches = re.findall(r'[A-Z]{2}\d{3,4}', str(flight_number).upper())
+            flight_matches = _FLIGHT_NUMBER.findall(str(flight_number).upper())
             if flight_matches:
                 flight_numbers = flight_matches
             elif flight_number and flight_number.strip():
@@ -454,7 +716,7 @@ class VisionExtractor:
         total_value = data.get('total_value')
         if isinstance(total_value, str):
             # Remove any currency symbols or commas
-            total_value = re.sub(r'[^\d.]', '', total_value)
+            total_value = _NON_NUMERIC.sub('', total_value)
             try:
                 total_value = float(total_value)
             except ValueError:
@@ -18,7 +18,7 @@ These models serve as the contract between:
 
 from dataclasses import dataclass, field, asdict
 from datetime import date, datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Set, Any, NamedTuple
 from enum import Enum
 import re
 
@@ -89,16 +89,21 @@ class ValidationSeverity(str, Enum):
     INFO = "INFO"        # Informational only
 
 
-@dataclass
-class ValidationIssue:
-    """A single validation issue"""
+class ValidationIssue(NamedTuple):
+    """
+    A single validation issue.
+    
+    Design Note: A NamedTuple rather than a dataclass - issues are created
+    on every validate() pass and never mutated, so the cheaper tuple
+    construction and storage are all we need.
+    """
     severity: ValidationSeverity
     field: str
     message: str
     suggestion: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ExtractionResult:
     """
     Result of extracting data from a single document page.
@@ -144,7 +149,7 @@ class ExtractionResult:
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class SAPPDOData:
     """
     Data extracted from SAP Export Excel file.
@@ -196,7 +201,7 @@ class SAPPDOData:
         return issues
 
 
-@dataclass
+@dataclass(slots=True)
 class InboundShipment:
     """
     Complete inbound shipment record ready for declaration.
@@ -236,7 +241,7 @@ class InboundShipment:
     source_files: List[str] = field(default_factory=list)
     extraction_confidence: ExtractionConfidence = ExtractionConfidence.MEDIUM
     validation_issues: List[ValidationIssue] = field(default_factory=list)
-    user_modified_fields: List[str] = field(default_factory=list)
+    user_modified_fields: Set[str] = field(default_factory=set)
     
     def get_brand_string(self) -> str:
         """Format brands for display"""
@@ -320,7 +325,7 @@ class InboundShipment:
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for UI/serialization"""
-        return {
+        result = {
             'reference': self.reference,
             'etd_date': self.etd_date.isoformat() if self.etd_date else None,
             'tracking_or_awb': self.tracking_or_awb,
@@ -332,11 +337,13 @@ class InboundShipment:
             'brands': self.get_brand_string(),
             'currency': self.currency,
             'total_value': self.total_value,
-            **{k: v for k, v in self.country_splits.items()}
         }
+        if self.country_splits:
+            result.update(self.country_splits)
+        return result
 
 
-@dataclass
+@dataclass(slots=True)
 class OutboundShipment:
     """
     Outbound shipment record for declaration.
@@ -367,7 +374,7 @@ class OutboundShipment:
     fcl_lcl: str = "LCL"
     
     # Metadata
-    awb_file: Optional[str] = None
+    awb_file: Optional[str] = None  # Matched AWB filename
     invoice_file: Optional[str] = None
     extraction_confidence: ExtractionConfidence = ExtractionConfidence.MEDIUM
     validation_issues: List[ValidationIssue] = field(default_factory=list)
@@ -418,7 +425,7 @@ class OutboundShipment:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class AuditEntry:
     """
     Single audit log entry for tracking changes.
@@ -451,13 +458,20 @@ class AuditEntry:
 
 
 # Utility functions for date parsing
+_MONTH_MAP = {
+    'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
+    'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12
+}
+_DDMMMYY = re.compile(r'(\d{1,2})([A-Z]{3})(\d{2})')
+
+
 def parse_date_flexible(date_str: str) -> Optional[date]:
     """
     Parse dates from various formats found in shipping documents.
     
     Supported formats:
     - 23SEP25, 29SEP25 (courier labels)
-    - 2025-09-23 (ISO)
+    - 2025-09-23, 20250923 (ISO)
     - 23/09/2025, 23-09-2025 (European)
     - 09/23/2025 (US)
     - 23-Sep-25, 23 Sep 2025
@@ -469,31 +483,55 @@ def parse_date_flexible(date_str: str) -> Optional[date]:
     
     date_str = str(date_str).strip()
     
-    # Common patterns to try
-    patterns = [
-        (r'(\d{1,2})([A-Z]{3})(\d{2,4})', '%d%b%y'),  # 23SEP25
-        (r'(\d{4})-(\d{2})-(\d{2})', '%Y-%m-%d'),     # 2025-09-23
-        (r'(\d{2})/(\d{2})/(\d{4})', '%d/%m/%Y'),     # 23/09/2025
-        (r'(\d{2})-(\d{2})-(\d{4})', '%d-%m-%Y'),     # 23-09-2025
-        (r'(\d{1,2})-([A-Za-z]{3})-(\d{2,4})', '%d-%b-%y'),  # 23-Sep-25
-    ]
+    # Fast dispatch on the shapes we see most often, so the common cases
+    # never reach the exception-driven strptime loop below
+    length = len(date_str)
+    if length == 7 and date_str[2:5].isalpha():
+        # DDMMMYY (23SEP25)
+        month = _MONTH_MAP.get(date_str[2:5].upper())
+        if month and date_str[:2].isdigit() and date_str[5:].isdigit():
+            try:
+                return date(2000 + int(date_str[5:]), month, int(date_str[:2]))
+            except ValueError:
+                pass
+    elif length == 8 and date_str.isdigit():
+        # Compact ISO (20250923)
+        try:
+            return date.fromisoformat(date_str)
+        except ValueError:
+            pass
+    elif length == 10:
+        if date_str[4] == '-':
+            # ISO (2025-09-23)
+            try:
+                return date.fromisoformat(date_str)
+            except ValueError:
+                pass
+        elif (date_str[2] in '/-' and date_str[5] == date_str[2]
+              and date_str[:2].isdigit() and date_str[3:5].isdigit()
+              and date_str[6:].isdigit()):
+            # European (23/09/2025, 23-09-2025)
+            try:
+                return date(int(date_str[6:]), int(date_str[3:5]), int(date_str[:2]))
+            except ValueError:
+                pass
     
     # Try format DDMMMYY (23SEP25)
-    match = re.match(r'(\d{1,2})([A-Z]{3})(\d{2})', date_str.upper())
+    match = _DDMMMYY.match(date_str.upper())
     if match:
         try:
             day, month, year = match.groups()
             year_full = 2000 + int(year)
-            month_map = {
-                'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
-                'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12
-            }
-            if month in month_map:
-                return date(year_full, month_map[month], int(day))
+            if month in _MONTH_MAP:
+                return date(year_full, _MONTH_MAP[month], int(day))
         except (ValueError, KeyError):
             pass
     
-    # Try ISO format
+    # Try ISO format (date only first, then full datetime strings)
+    try:
+        return date.fromisoformat(date_str)
+    except ValueError:
+        pass
     try:
         return datetime.fromisoformat(date_str).date()
     except ValueError:
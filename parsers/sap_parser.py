@@ -20,15 +20,20 @@ Known Data Patterns in SAP Exports:
 
 import pandas as pd
 import re
+import sys
 import logging
 from typing import Dict, List, Optional, BinaryIO, Tuple
 from pathlib import Path
 
 from models.shipment import SAPPDOData, ValidationIssue, ValidationSeverity
 from config.settings import Settings
+from utils.patterns import PDO_NUMBER
 
 logger = logging.getLogger(__name__)
 
+# "USD 1,234.56" -> currency code, amount
+_CURRENCY_VALUE = re.compile(r'([A-Z]{3})\s*([\d,\.]+)')
+
 
 class SAPParserError(Exception):
     """Custom exception for SAP parsing errors"""
@@ -86,9 +91,9 @@ class SAPParser:
                 pdo_data = self._parse_sheet(xl, sheet_name, str(getattr(file_source, 'name', 'unknown')))
                 if pdo_data:
                     results[sheet_name] = pdo_data
-                    logger.info(f"Parsed {sheet_name}: {pdo_data.currency} {pdo_data.total_value:.2f}")
+                    logger.info("Parsed %s: %s %.2f", sheet_name, pdo_data.currency, pdo_data.total_value)
             except Exception as e:
-                logger.warning(f"Failed to parse sheet {sheet_name}: {e}")
+                logger.warning("Failed to parse sheet %s: %s", sheet_name, e)
                 continue
         
         return results
@@ -109,7 +114,7 @@ class SAPParser:
         # Find header row
         header_row = self._find_header_row(df_raw)
         if header_row is None:
-            logger.debug(f"No valid header found in {sheet_name}")
+            logger.debug("No valid header found in %s", sheet_name)
             return None
         
         # Re-read with header
@@ -119,7 +124,7 @@ class SAPParser:
         column_map = self._map_columns(df.columns)
         
         if 'total' not in column_map:
-            logger.warning(f"No Total column found in {sheet_name}")
+            logger.warning("No Total column found in %s", sheet_name)
             return None
         
         # Extract data
@@ -159,17 +164,19 @@ class SAPParser:
                 brands.add(brand)
         
         if total_value == 0:
-            logger.debug(f"No valid data rows in {sheet_name}")
+            logger.debug("No valid data rows in %s", sheet_name)
             return None
         
         # Extract PDO number from sheet name
-        pdo_match = re.search(r'(\d{7})', sheet_name)
-        pdo_number = pdo_match.group(1) if pdo_match else sheet_name
+        pdo_match = PDO_NUMBER.search(sheet_name)
+        pdo_number = pdo_match.group() if pdo_match else sheet_name
         
+        # Interned so later equality checks and dict lookups on these small
+        # vocabularies (PDO numbers, currencies, brands) short-circuit on identity
         return SAPPDOData(
-            pdo_number=pdo_number,
-            brands=list(brands),
-            currency=currency or 'USD',
+            pdo_number=sys.intern(pdo_number),
+            brands=[sys.intern(b) for b in brands],
+            currency=sys.intern(currency or 'USD'),
             total_value=total_value,
             country_splits=country_splits,
             source_file=source_file,
@@ -224,7 +231,7 @@ class SAPParser:
         if not value_str:
             return None
         
-        match = re.match(r'([A-Z]{3})\s*([\d,\.]+)', str(value_str))
+        match = _CURRENCY_VALUE.match(str(value_str))
         if match:
             currency = match.group(1)
             amount_str = match.group(2).replace(',', '')
@@ -270,11 +277,11 @@ def match_pdo_to_filename(filename: str, pdo_data: Dict[str, SAPPDOData]) -> Lis
     pdo_numbers = extract_pdo_numbers(filename)
     
     if not pdo_numbers:
-        logger.debug(f"No PDO numbers found in filename: {filename}")
+        logger.debug("No PDO numbers found in filename: %s", filename)
         return matches
     
     if not pdo_data:
-        logger.warning(f"No SAP data available to match against filename: {filename}")
+        logger.warning("No SAP data available to match against filename: %s", filename)
         return matches
     
     for pdo_num in pdo_numbers:
@@ -286,14 +293,14 @@ def match_pdo_to_filename(filename: str, pdo_data: Dict[str, SAPPDOData]) -> Lis
             if data.pdo_number == pdo_num:
                 matches.append((pdo_num, data))
                 found = True
-                logger.debug(f"Exact match: PDO {pdo_num} -> {sheet_name}")
+                logger.debug("Exact match: PDO %s -> %s", pdo_num, sheet_name)
                 break
             
             # Method 2: PDO number substring in sheet name
             if pdo_num in sheet_name:
                 matches.append((pdo_num, data))
                 found = True
-                logger.debug(f"Substring match: PDO {pdo_num} in sheet '{sheet_name}'")
+                logger.debug("Substring match: PDO %s in sheet '%s'", pdo_num, sheet_name)
                 break
             
             # Method 3: Fuzzy match - last 5 digits
@@ -301,15 +308,14 @@ def match_pdo_to_filename(filename: str, pdo_data: Dict[str, SAPPDOData]) -> Lis
                 if pdo_num[-5:] == data.pdo_number[-5:]:
                     matches.append((pdo_num, data))
                     found = True
-                    logger.debug(f"Fuzzy match: PDO {pdo_num} ~ {data.pdo_number}")
+                    logger.debug("Fuzzy match: PDO %s ~ %s", pdo_num, data.pdo_number)
                     break
         
         if not found:
             # List available PDO numbers for debugging
-            available_pdos = [d.pdo_number for d in pdo_data.values()]
             logger.warning(
-                f"No SAP match for PDO {pdo_num} from filename '{filename}'. "
-                f"Available PDOs in SAP: {available_pdos}"
+                "No SAP match for PDO %s from filename '%s'. Available PDOs in SAP: %s",
+                pdo_num, filename, [d.pdo_number for d in pdo_data.values()]
             )
     
     return matches
@@ -17,11 +17,19 @@ Design Principles:
 """
 
 import os
+import re
+import copy
+import hashlib
 import tempfile
+import threading
+import time
 import logging
+from collections import Counter, OrderedDict, deque
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Dict, Optional, Callable, Any, BinaryIO
+from typing import List, Dict, Deque, Optional, Callable, Any, BinaryIO, Tuple
 from pathlib import Path
 
 from config.settings import Settings
@@ -35,14 +43,49 @@ from extractors.vision_extractor import (
 )
 from generators.excel_generator import ExcelGenerator
 from utils.helpers import (
-    RateLimiter, AuditTrail, extract_pdo_numbers, extract_itr_number
+    create_rate_limiter, AuditTrail, extract_pdo_numbers, extract_itr_number
 )
+from utils.patterns import ITR_REFERENCE
 from classifiers.product_classifier import classify_description
 
 logger = logging.getLogger(__name__)
 
+# Parsed SAP workbooks keyed by file content and parser configuration, shared
+# across pipeline instances so re-uploading an identical export skips parsing
+_sap_cache: "OrderedDict[Tuple[str, Tuple[Tuple[str, str], ...]], Dict[str, SAPPDOData]]" = OrderedDict()
+_sap_cache_lock = threading.Lock()
 
-@dataclass
+
+def _file_digest(file: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file-like object's content and rewind it"""
+    digest = hashlib.blake2b(digest_size=16)
+    file.seek(0)
+    for chunk in iter(lambda: file.read(chunk_size), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+# "Description:" segment of extractor notes. AWB notes are "|"-joined fields;
+# invoice notes end with the (verbatim) description
+_AWB_DESCRIPTION_PATTERN = re.compile(r'Description:([^|]*)')
+_INVOICE_DESCRIPTION_PATTERN = re.compile(r'Description:(.*)', re.DOTALL)
+
+
+def _extract_description(notes: Optional[str], pattern: "re.Pattern[str]") -> Optional[str]:
+    """Pull the description out of extractor notes, or None if absent"""
+    if not notes:
+        return None
+    match = pattern.search(notes)
+    return match.group(1).strip() if match else None
+
+
+def _itr_key(itr_num: str) -> str:
+    """Normalize an ITR/SOM reference for index lookups ("ITR 2502027" -> "itr2502027")"""
+    return itr_num.replace(' ', '').lower()
+
+
+@dataclass(slots=True)
 class ProcessingProgress:
     """Tracks processing progress for UI updates"""
     stage: str = ""
@@ -59,7 +102,7 @@ class ProcessingProgress:
         return (self.items_processed / self.total_items) * 100
 
 
-@dataclass
+@dataclass(slots=True)
 class PipelineResult:
     """Result of pipeline processing"""
     success: bool
@@ -84,15 +127,20 @@ class ProcessingPipeline:
     
     def __init__(self, settings: Settings):
         self.settings = settings
-        self.audit = AuditTrail()
-        self.rate_limiter = RateLimiter(settings.api.delay_seconds)
+        self.audit = AuditTrail(settings.cache.max_audit_entries)
+        self.rate_limiter = create_rate_limiter(settings.api)
         
         # Initialize components
         self.sap_parser = SAPParser(settings)
-        self.pdf_processor = PDFProcessor(settings.processing.pdf_zoom_factor)
+        self.pdf_processor = PDFProcessor(
+            settings.processing.pdf_zoom_factor,
+            settings.processing.render_workers
+        )
         self.extractor: Optional[VisionExtractor] = None  # Lazy init (needs API key)
         self.excel_generator = ExcelGenerator(settings)
         
+        self._last_progress_at = 0.0
+        
         # State
         self.sap_data: Dict[str, SAPPDOData] = {}
         self.inbound_shipments: List[InboundShipment] = []
@@ -137,21 +185,18 @@ class ProcessingPipeline:
             if not is_valid:
                 progress.errors.append(f"Invalid file {filename}: {error_msg}")
                 progress.items_processed += 1
-                if progress_callback:
-                    progress_callback(progress)
+                self._report_progress(progress_callback, progress)
                 continue
             
             try:
-                parsed = self.sap_parser.parse_file(file)
+                parsed = self._parse_sap_file_cached(file, filename)
                 self.sap_data.update(parsed)
                 
                 # Audit
-                for pdo_num, data in parsed.items():
-                    self.audit.log_extraction(
-                        pdo_num, "sap_data",
-                        f"{data.currency} {data.total_value:.2f}",
-                        "SAP"
-                    )
+                self.audit.log_extractions_bulk(
+                    (pdo_num, "sap_data", f"{data.currency} {data.total_value:.2f}", "SAP")
+                    for pdo_num, data in parsed.items()
+                )
                 
                 progress.items_processed += 1
                 logger.info(f"Parsed {filename}: {len(parsed)} PDO sheets")
@@ -160,11 +205,51 @@ class ProcessingPipeline:
                 progress.errors.append(f"Failed to parse {filename}: {e}")
                 logger.error(f"SAP parse error for {filename}: {e}")
             
-            if progress_callback:
-                progress_callback(progress)
+            self._report_progress(progress_callback, progress)
         
+        self._report_progress(progress_callback, progress, final=True)
         return self.sap_data
     
+    def _report_progress(
+        self,
+        progress_callback: Optional[Callable[[ProcessingProgress], None]],
+        progress: ProcessingProgress,
+        final: bool = False
+    ) -> None:
+        """Invoke the progress callback at most once per progress interval (always when final)"""
+        if not progress_callback:
+            return
+        now = time.monotonic()
+        if final or now - self._last_progress_at >= self.settings.processing.progress_interval_seconds:
+            self._last_progress_at = now
+            progress_callback(progress)
+    
+    def _parse_sap_file_cached(self, file: BinaryIO, filename: str) -> Dict[str, SAPPDOData]:
+        """Parse an SAP file, reusing a previous parse of identical content"""
+        # The country mapping shapes the parsed splits, so it is part of the key
+        key = (_file_digest(file), tuple(sorted(self.sap_parser.country_mapping.items())))
+        
+        with _sap_cache_lock:
+            cached = _sap_cache.get(key)
+            if cached is not None:
+                _sap_cache.move_to_end(key)
+        
+        if cached is not None:
+            logger.info(f"Using cached parse for {filename}")
+            parsed = copy.deepcopy(cached)
+            for data in parsed.values():
+                data.source_file = filename
+            return parsed
+        
+        parsed = self.sap_parser.parse_file(file)
+        
+        with _sap_cache_lock:
+            _sap_cache[key] = copy.deepcopy(parsed)
+            while len(_sap_cache) > max(0, self.settings.cache.max_sap_entries):
+                _sap_cache.popitem(last=False)
+        
+        return parsed
+    
     # =========================================================================
     # Stage 2: Inbound PDF Processing
     # =========================================================================
@@ -187,68 +272,133 @@ class ProcessingPipeline:
         self._start_time = datetime.now()
         extractor = self._get_extractor()
         
-        # Count total pages for progress
-        total_pages = sum(
-            self.pdf_processor.get_page_count(f['path'])
-            for f in pdf_files
-        )
-        
-        progress = ProcessingProgress(
-            stage="Inbound Extraction",
-            total_items=total_pages
-        )
-        
+        # Count pages once per file (used for progress and for scheduling)
+        progress = ProcessingProgress(stage="Inbound Extraction")
+        page_counts: Dict[str, int] = {}
         for pdf_info in pdf_files:
-            filename = pdf_info['name']
-            pdf_path = pdf_info['path']
-            
-            progress.current_item = filename
-            
             try:
-                # Extract from all pages
-                page_count = self.pdf_processor.get_page_count(pdf_path)
-                page_results = []
+                page_counts[pdf_info['path']] = self.pdf_processor.get_page_count(pdf_info['path'])
+            except Exception as e:
+                progress.errors.append(f"Failed to process {pdf_info['name']}: {e}")
+                logger.error(f"Inbound processing error for {pdf_info['name']}: {e}")
+        progress.total_items = sum(page_counts.values())
+        
+        # Files are rendered on the calling thread (MuPDF is not thread-safe;
+        # render_workers fans out to processes) and their pages queued on one
+        # bounded pool, so API latency overlaps across files while the shared
+        # rate limiter still spaces out request starts. At most max_concurrency
+        # rendered files are in flight, and the next one is only rendered after
+        # a progress update, so memory stays bounded and the UI keeps moving.
+        # Progress callbacks stay on the calling thread (Streamlit requirement).
+        window = max(1, self.settings.api.max_concurrency)
+        pending = deque(p for p in pdf_files if p['path'] in page_counts)
+        in_flight: Deque[tuple] = deque()
+        
+        with ThreadPoolExecutor(max_workers=window) as executor:
+            while pending or in_flight:
+                if not in_flight:
+                    job = self._submit_inbound_file(executor, extractor, pending, page_counts, progress)
+                    if job is not None:
+                        in_flight.append(job)
+                    continue
                 
-                for page_num in range(page_count):
-                    # Convert page to image
-                    base64_img = self.pdf_processor.page_to_base64(pdf_path, page_num)
-                    
-                    # Extract with AI
-                    result = extractor.extract_from_image(
-                        base64_img,
-                        prompt_type="inbound",
-                        page_number=page_num + 1
-                    )
-                    page_results.append(result)
+                filename, page_count, futures = in_flight.popleft()
+                progress.current_item = filename
+                
+                try:
+                    # Collect all pages, kept in page order
+                    page_results: List = [None] * page_count
                     
-                    progress.items_processed += 1
-                    if progress_callback:
-                        progress_callback(progress)
+                    for future in as_completed(futures):
+                        page_nums = futures[future]
+                        for page_num, result in zip(page_nums, future.result()):
+                            page_results[page_num] = result
+                        
+                        progress.items_processed += len(page_nums)
+                        self._report_progress(progress_callback, progress)
+                        
+                        # Render the next file (one per update) while this one finishes
+                        if pending and len(in_flight) < window - 1:
+                            job = self._submit_inbound_file(executor, extractor, pending, page_counts, progress)
+                            if job is not None:
+                                in_flight.append(job)
                     
                     # Log extraction
-                    self.audit.log_extraction(
-                        filename,
-                        f"page_{page_num + 1}",
-                        result.document_type.value,
-                        "AI"
+                    self.audit.log_extractions_bulk(
+                        (filename, f"page_{page_num + 1}", result.document_type.value, "AI")
+                        for page_num, result in enumerate(page_results)
                     )
-                
-                # Aggregate results
-                aggregated = DocumentAggregator.aggregate_inbound(page_results, filename)
-                
-                # Match with SAP data
-                pdo_matches = match_pdo_to_filename(filename, self.sap_data)
-                
-                # Create shipment record
-                shipment = self._create_inbound_shipment(filename, aggregated, pdo_matches)
-                self.inbound_shipments.append(shipment)
-                
-            except Exception as e:
-                progress.errors.append(f"Failed to process {filename}: {e}")
-                logger.error(f"Inbound processing error for {filename}: {e}")
+                    
+                    # Aggregate results
+                    aggregated = DocumentAggregator.aggregate_inbound(page_results, filename)
+                    
+                    # Match with SAP data
+                    pdo_matches = match_pdo_to_filename(filename, self.sap_data)
+                    
+                    # Create shipment record
+                    shipment = self._create_inbound_shipment(filename, aggregated, pdo_matches)
+                    self.inbound_shipments.append(shipment)
+                    
+                except Exception as e:
+                    for future in futures:
+                        future.cancel()
+                    progress.errors.append(f"Failed to process {filename}: {e}")
+                    logger.error(f"Inbound processing error for {filename}: {e}")
         
+        self._report_progress(progress_callback, progress, final=True)
         return self.inbound_shipments
     
+    def _submit_inbound_file(
+        self,
+        executor: ThreadPoolExecutor,
+        extractor: VisionExtractor,
+        pending: Deque[Dict[str, Any]],
+        page_counts: Dict[str, int],
+        progress: ProcessingProgress
+    ) -> Optional[tuple]:
+        """
+        Render the next pending PDF and queue its page groups on the pool.
+        
+        Returns (filename, page_count, futures -> page numbers), or None
+        once no file in `pending` could be rendered.
+        """
+        while pending:
+            pdf_info = pending.popleft()
+            page_count = page_counts[pdf_info['path']]
+            try:
+                images = self.pdf_processor.pages_to_base64(pdf_info['path'], list(range(page_count)))
+            except Exception as e:
+                progress.errors.append(f"Failed to process {pdf_info['name']}: {e}")
+                logger.error(f"Inbound processing error for {pdf_info['name']}: {e}")
+                continue
+            
+            # Pages are grouped into requests of api.pages_per_request
+            chunk_size = max(1, self.settings.api.pages_per_request)
+            futures = {
+                executor.submit(self._extract_inbound_pages, extractor, images[start:start + chunk_size], start):
+                    list(range(start, min(start + chunk_size, page_count)))
+                for start in range(0, page_count, chunk_size)
+            }
+            return pdf_info['name'], page_count, futures
+        return None
+    
+    def _extract_first_page(self, extract: Callable, pdf_path: str):
+        """Render and extract page 0 of an outbound document (runs on a worker thread)"""
+        return extract(self.pdf_processor.page_to_base64(pdf_path, 0))
+    
+    def _extract_inbound_pages(
+        self,
+        extractor: VisionExtractor,
+        images: List[str],
+        first_page: int
+    ) -> List:
+        """Extract a group of consecutive inbound pages (runs on a worker thread)"""
+        return extractor.extract_from_images_batch(
+            images,
+            prompt_type="inbound",
+            page_numbers=list(range(first_page + 1, first_page + 1 + len(images)))
+        )
+    
     def _create_inbound_shipment(
         self,
         filename: str,
@@ -265,17 +415,16 @@ class ProcessingPipeline:
             reference = ", ".join(f"PDO{n}" for n in pdo_nums) if pdo_nums else filename
         
         # Get SAP data (combine if multiple matches)
-        sap_brands = []
+        sap_brands: Dict[str, None] = {}  # Ordered set
         total_value = 0.0
         currency = None
-        country_splits = {}
+        country_splits: Counter = Counter()
         
         for _, sap_data in pdo_matches:
-            sap_brands.extend(sap_data.brands)
+            sap_brands.update(dict.fromkeys(sap_data.brands))
             total_value += sap_data.total_value
             currency = currency or sap_data.currency
-            for country, value in sap_data.country_splits.items():
-                country_splits[country] = country_splits.get(country, 0) + value
+            country_splits.update(sap_data.country_splits)
         
         # BRAND CODE PRIORITY:
         # 1. Extracted brand_codes from PURCHASE_ORDER documents (source of truth)
@@ -286,7 +435,7 @@ class ProcessingPipeline:
             brands = extracted_brands
         else:
             # Fall back to SAP brands (but don't infer/guess)
-            brands = list(set(sap_brands)) if sap_brands else []
+            brands = list(sap_brands)
         
         # Flight string
         flight_vessel = " / ".join(aggregated['flight_numbers']) if aggregated['flight_numbers'] else None
@@ -303,7 +452,7 @@ class ProcessingPipeline:
             brands=brands,
             currency=currency,
             total_value=total_value if total_value > 0 else None,
-            country_splits=country_splits,
+            country_splits=dict(country_splits),
             source_files=[filename],
             extraction_confidence=aggregated.get('confidence', ExtractionConfidence.MEDIUM)
         )
@@ -342,32 +491,51 @@ class ProcessingPipeline:
             total_items=total_files
         )
         
+        # Queue every AWB and invoice up front so API latency overlaps;
+        # results are still consumed in upload order below
+        extract_awb = extractor.specialize("outbound_awb")
+        extract_invoice = extractor.specialize("outbound_invoice")
+        executor = ThreadPoolExecutor(max_workers=max(1, self.settings.api.max_concurrency))
+        awb_futures = [
+            executor.submit(self._extract_first_page, extract_awb, awb_info['path'])
+            for awb_info in awb_files
+        ]
+        inv_futures = [
+            executor.submit(self._extract_first_page, extract_invoice, inv_info['path'])
+            for inv_info in invoice_files
+        ]
+        executor.shutdown(wait=False)
+        
         # Process AWBs
         awb_extractions = {}
         matched_awbs = set()  # Track which AWBs have been matched to invoices
         
-        for awb_info in awb_files:
+        for awb_info, future in zip(awb_files, awb_futures):
             progress.current_item = awb_info['name']
             
             try:
-                base64_img = self.pdf_processor.page_to_base64(awb_info['path'], 0)
-                result = extractor.extract_from_image(base64_img, "outbound_awb")
+                result = future.result()
                 awb_extractions[awb_info['name']] = result
                 
             except Exception as e:
                 progress.errors.append(f"AWB extraction failed for {awb_info['name']}: {e}")
             
             progress.items_processed += 1
-            if progress_callback:
-                progress_callback(progress)
+            self._report_progress(progress_callback, progress)
+        
+        # Index AWBs by every ITR/SOM reference in their filename; the first
+        # AWB (in upload order) wins, as with the previous linear scan
+        itr_to_awb: Dict[str, str] = {}
+        for awb_name in awb_extractions:
+            for match in ITR_REFERENCE.finditer(awb_name):
+                itr_to_awb.setdefault(_itr_key(match.group(1) + match.group(2)), awb_name)
         
         # Process Invoices and match with AWBs
-        for inv_info in invoice_files:
+        for inv_info, future in zip(invoice_files, inv_futures):
             progress.current_item = inv_info['name']
             
             try:
-                base64_img = self.pdf_processor.page_to_base64(inv_info['path'], 0)
-                inv_result = extractor.extract_from_image(base64_img, "outbound_invoice")
+                inv_result = future.result()
                 
                 # Find matching AWB
                 itr_num = extract_itr_number(inv_info['name'])
@@ -375,18 +543,17 @@ class ProcessingPipeline:
                 matching_awb_name = None
                 
                 if itr_num:
-                    for awb_name, awb_result in awb_extractions.items():
-                        if itr_num.replace(' ', '').lower() in awb_name.replace(' ', '').lower():
-                            matching_awb = awb_result
-                            matching_awb_name = awb_name
-                            matched_awbs.add(awb_name)
-                            break
+                    matching_awb_name = itr_to_awb.get(_itr_key(itr_num))
+                    if matching_awb_name is not None:
+                        matching_awb = awb_extractions[matching_awb_name]
+                        matched_awbs.add(matching_awb_name)
                 
                 # Create outbound shipment
                 shipment = self._create_outbound_shipment(
                     inv_info['name'],
                     inv_result,
-                    matching_awb
+                    matching_awb,
+                    matching_awb_name
                 )
                 self.outbound_shipments.append(shipment)
                 
@@ -394,8 +561,7 @@ class ProcessingPipeline:
                 progress.errors.append(f"Invoice extraction failed for {inv_info['name']}: {e}")
             
             progress.items_processed += 1
-            if progress_callback:
-                progress_callback(progress)
+            self._report_progress(progress_callback, progress)
         
         # Create shipments for AWBs without matching invoices
         for awb_name, awb_result in awb_extractions.items():
@@ -404,18 +570,21 @@ class ProcessingPipeline:
                 shipment = self._create_outbound_shipment(
                     awb_name,
                     None,  # No invoice
-                    awb_result
+                    awb_result,
+                    awb_name
                 )
                 self.outbound_shipments.append(shipment)
                 progress.warnings.append(f"AWB {awb_name} processed without matching invoice")
         
+        self._report_progress(progress_callback, progress, final=True)
         return self.outbound_shipments
     
     def _create_outbound_shipment(
         self,
         filename: str,
         inv_result,
-        awb_result
+        awb_result,
+        awb_filename: Optional[str] = None
     ) -> OutboundShipment:
         """
         Create OutboundShipment from extraction results.
@@ -451,13 +620,8 @@ class ProcessingPipeline:
             if awb_result.currency:
                 currency = awb_result.currency
             
-            # Extract description from AWB notes
-            if awb_result.notes and 'Description:' in awb_result.notes:
-                desc_match = awb_result.notes.split('Description:')
-                if len(desc_match) > 1:
-                    # Get the part after "Description:" and before next "|"
-                    desc_part = desc_match[1].split('|')[0].strip()
-                    description = desc_part
+            # Extract description from AWB notes (up to the next "|")
+            description = _extract_description(awb_result.notes, _AWB_DESCRIPTION_PATTERN)
         
         # Extract Invoice data (takes priority for financial info ONLY)
         if inv_result:
@@ -475,10 +639,8 @@ class ProcessingPipeline:
                 destination = inv_result.destination_country
             
             # Extract description from notes if present (only if AWB description not available)
-            if not description and inv_result.notes and 'Description:' in inv_result.notes:
-                desc_match = inv_result.notes.split('Description:')
-                if len(desc_match) > 1:
-                    description = desc_match[1].strip()
+            if not description:
+                description = _extract_description(inv_result.notes, _INVOICE_DESCRIPTION_PATTERN)
         
         # DATE PRIORITY FOR OUTBOUND: AWB "Executed on" date takes priority
         # The AWB date is when the shipment was actually executed/shipped
@@ -502,7 +664,7 @@ class ProcessingPipeline:
             description=product_category,  # Use classified category instead of raw description
             currency=currency,
             value=value,
-            awb_file=awb_result.raw_response[:100] if awb_result else None,
+            awb_file=awb_filename if awb_result else None,
             invoice_file=filename
         )
     
@@ -518,24 +680,29 @@ class ProcessingPipeline:
             Dictionary mapping reference -> list of validation issues
         """
         issues = {}
+        audit_records = []
         
         for shipment in self.inbound_shipments:
             shipment_issues = shipment.validate()
-            if shipment_issues:
-                issues[shipment.reference] = shipment_issues
-                self.audit.log_validation(
-                    shipment.reference,
-                    [f"{i.severity.value}: {i.message}" for i in shipment_issues]
-                )
+            if not shipment_issues:
+                continue
+            issues[shipment.reference] = shipment_issues
+            audit_records.append((
+                shipment.reference,
+                [f"{i.severity.value}: {i.message}" for i in shipment_issues]
+            ))
         
         for shipment in self.outbound_shipments:
             shipment_issues = shipment.validate()
-            if shipment_issues:
-                issues[shipment.invoice_number] = shipment_issues
-                self.audit.log_validation(
-                    shipment.invoice_number,
-                    [f"{i.severity.value}: {i.message}" for i in shipment_issues]
-                )
+            if not shipment_issues:
+                continue
+            issues[shipment.invoice_number] = shipment_issues
+            audit_records.append((
+                shipment.invoice_number,
+                [f"{i.severity.value}: {i.message}" for i in shipment_issues]
+            ))
+        
+        self.audit.log_validations_bulk(audit_records)
         
         return issues
     
@@ -543,7 +710,7 @@ class ProcessingPipeline:
     # Stage 5: Excel Generation
     # =========================================================================
     
-    def generate_excel(self, declaration_period: str) -> bytes:
+    def generate_excel(self, declaration_period: str) -> BinaryIO:
         """
         Generate the final Excel declaration file.
         
@@ -551,7 +718,7 @@ class ProcessingPipeline:
             declaration_period: Period string like "October-25"
             
         Returns:
-            Excel file as bytes
+            Excel file as a BytesIO rewound to the start (no bytes copy)
         """
         buffer = self.excel_generator.generate(
             self.inbound_shipments,
@@ -560,12 +727,15 @@ class ProcessingPipeline:
         )
         
         # Log export
-        for shipment in self.inbound_shipments:
-            self.audit.log_export(shipment.reference, "Excel")
-        for shipment in self.outbound_shipments:
-            self.audit.log_export(shipment.invoice_number, "Excel")
+        self.audit.log_exports_bulk(
+            chain(
+                (s.reference for s in self.inbound_shipments),
+                (s.invoice_number for s in self.outbound_shipments)
+            ),
+            "Excel"
+        )
         
-        return buffer.read()
+        return buffer
     
     # =========================================================================
     # Results and State Management
@@ -589,24 +759,27 @@ class ProcessingPipeline:
         """Update an inbound shipment (user edit)"""
         if 0 <= index < len(self.inbound_shipments):
             shipment = self.inbound_shipments[index]
-            
-            for field, new_value in updates.items():
-                old_value = getattr(shipment, field, None)
-                if old_value != new_value:
-                    setattr(shipment, field, new_value)
-                    shipment.user_modified_fields.append(field)
-                    self.audit.log_user_edit(shipment.reference, field, old_value, new_value)
+            changes = self._apply_user_edits(shipment, shipment.reference, updates)
+            shipment.user_modified_fields.update(field for field, _, _ in changes)
     
     def update_outbound_shipment(self, index: int, updates: Dict[str, Any]):
         """Update an outbound shipment (user edit)"""
         if 0 <= index < len(self.outbound_shipments):
             shipment = self.outbound_shipments[index]
-            
-            for field, new_value in updates.items():
-                old_value = getattr(shipment, field, None)
-                if old_value != new_value:
-                    setattr(shipment, field, new_value)
-                    self.audit.log_user_edit(shipment.invoice_number, field, old_value, new_value)
+            self._apply_user_edits(shipment, shipment.invoice_number, updates)
+    
+    def _apply_user_edits(self, shipment, reference: str, updates: Dict[str, Any]) -> List[tuple]:
+        """Set the fields that actually changed and audit them in one call"""
+        changes = [
+            (field, old_value, new_value)
+            for field, new_value in updates.items()
+            if (old_value := getattr(shipment, field, None)) != new_value
+        ]
+        for field, _, new_value in changes:
+            setattr(shipment, field, new_value)
+        if changes:
+            self.audit.log_user_edits_bulk(reference, changes)
+        return changes
     
     def get_audit_trail(self):
         """Get the audit trail for export"""
@@ -16,16 +16,30 @@ Future Considerations:
 """
 
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Tuple, Any, Iterator
 from enum import Enum
 import logging
+import re
+import sys
 
 from models.shipment import (
     InboundShipment, SAPPDOData, ValidationIssue, ValidationSeverity
 )
+from utils.patterns import PDO_NUMBER
 
 logger = logging.getLogger(__name__)
 
+# Digit runs long enough to contain a PDO_NUMBER (7 digits)
+_PDO_LENGTH = 7
+_DIGIT_RUN = re.compile(r'\d{%d,}' % _PDO_LENGTH)
+
+# Report icon per issue severity
+_SEVERITY_ICON = {
+    ValidationSeverity.ERROR: "🔴",
+    ValidationSeverity.WARNING: "🟡",
+    ValidationSeverity.INFO: "ℹ️",
+}
+
 
 class ReconciliationType(str, Enum):
     """Types of reconciliation checks"""
@@ -37,7 +51,7 @@ class ReconciliationType(str, Enum):
     BRAND_MISMATCH = "BRAND_MISMATCH"
 
 
-@dataclass
+@dataclass(slots=True)
 class ReconciliationIssue:
     """A single reconciliation issue"""
     issue_type: ReconciliationType
@@ -50,7 +64,7 @@ class ReconciliationIssue:
     auto_resolvable: bool = False  # Can be auto-fixed by using SAP value
 
 
-@dataclass
+@dataclass(slots=True)
 class ReconciliationResult:
     """Result of reconciling a shipment with SAP data"""
     reference: str
@@ -70,12 +84,22 @@ class ReconciliationResult:
     def has_warnings(self) -> bool:
         return any(i.severity == ValidationSeverity.WARNING for i in self.issues)
     
+    def severity_counts(self) -> Tuple[int, int]:
+        """(error_count, warning_count) in a single pass over the issues"""
+        error, warning = ValidationSeverity.ERROR, ValidationSeverity.WARNING
+        error_count = warning_count = 0
+        for issue in self.issues:
+            if issue.severity == error:
+                error_count += 1
+            elif issue.severity == warning:
+                warning_count += 1
+        return error_count, warning_count
+    
     def get_summary(self) -> str:
-        if not self.has_issues:
+        if not self.issues:
             return "✅ Reconciled successfully"
         
-        error_count = sum(1 for i in self.issues if i.severity == ValidationSeverity.ERROR)
-        warning_count = sum(1 for i in self.issues if i.severity == ValidationSeverity.WARNING)
+        error_count, warning_count = self.severity_counts()
         
         parts = []
         if error_count:
@@ -112,7 +136,8 @@ class ReconciliationEngine:
         self,
         shipment: InboundShipment,
         sap_data: Dict[str, SAPPDOData],
-        auto_apply: bool = None
+        auto_apply: bool = None,
+        sap_index: Optional[Dict[str, SAPPDOData]] = None
     ) -> ReconciliationResult:
         """
         Reconcile an inbound shipment against SAP data.
@@ -121,6 +146,7 @@ class ReconciliationEngine:
             shipment: The extracted inbound shipment
             sap_data: Dictionary of PDO number -> SAPPDOData
             auto_apply: Override instance setting for auto-apply
+            sap_index: Prebuilt PDO lookup index (see _build_pdo_index)
             
         Returns:
             ReconciliationResult with any issues found
@@ -134,7 +160,7 @@ class ReconciliationEngine:
         )
         
         # Find matching SAP data
-        matched_sap = self._find_matching_sap(shipment.reference, sap_data)
+        matched_sap = self._find_matching_sap(shipment.reference, sap_data, sap_index)
         
         if not matched_sap:
             result.issues.append(ReconciliationIssue(
@@ -164,15 +190,18 @@ class ReconciliationEngine:
                     suggestion="SAP currency will be used",
                     auto_resolvable=True
                 ))
-                
-                if auto_apply:
-                    shipment.currency = matched_sap.currency
         
         # Check value match (with tolerance)
         if shipment.total_value and matched_sap.total_value:
-            diff_pct = abs(shipment.total_value - matched_sap.total_value) / matched_sap.total_value * 100
+            diff = abs(shipment.total_value - matched_sap.total_value)
             
-            if diff_pct > self.tolerance:
+            # Multiply-compare first; only divide for the message when the
+            # difference is actually outside tolerance. Non-positive SAP
+            # totals (credit notes) are never flagged, as with the original
+            # percentage test.
+            if (matched_sap.total_value > 0
+                    and diff * 100 > self.tolerance * matched_sap.total_value):
+                diff_pct = diff / matched_sap.total_value * 100
                 result.issues.append(ReconciliationIssue(
                     issue_type=ReconciliationType.VALUE_MISMATCH,
                     severity=ValidationSeverity.INFO if diff_pct < 10 else ValidationSeverity.WARNING,
@@ -183,50 +212,67 @@ class ReconciliationEngine:
                     suggestion="SAP value will be used (source of truth)",
                     auto_resolvable=True
                 ))
-                
-                if auto_apply:
-                    shipment.total_value = matched_sap.total_value
         
         # Apply SAP values for fields we know SAP is authoritative for
         if auto_apply:
-            # Currency
-            shipment.currency = matched_sap.currency
-            
-            # Total value
-            shipment.total_value = matched_sap.total_value
-            
-            # Brands
-            if matched_sap.brands:
-                shipment.brands = matched_sap.brands
-            
-            # Country splits
-            if matched_sap.country_splits:
-                shipment.country_splits = matched_sap.country_splits
+            self._apply_sap_authoritative(shipment, matched_sap)
         
         return result
     
+    @staticmethod
+    def _apply_sap_authoritative(shipment: InboundShipment, matched_sap: SAPPDOData):
+        """Overwrite the fields SAP is the source of truth for"""
+        shipment.currency = matched_sap.currency
+        shipment.total_value = matched_sap.total_value
+        if matched_sap.brands:
+            shipment.brands = matched_sap.brands
+        if matched_sap.country_splits:
+            shipment.country_splits = matched_sap.country_splits
+    
     def _find_matching_sap(
         self,
         reference: str,
-        sap_data: Dict[str, SAPPDOData]
+        sap_data: Dict[str, SAPPDOData],
+        sap_index: Optional[Dict[str, SAPPDOData]] = None
     ) -> Optional[SAPPDOData]:
-        """Find SAP data matching a shipment reference"""
-        import re
+        """
+        Find SAP data matching a shipment reference.
         
+        For each PDO number in the reference, the first sheet (in sap_data
+        order) whose pdo_number equals it or whose name contains it wins.
+        """
         # Extract PDO numbers from reference
-        pdo_pattern = r'(\d{7})'
-        pdo_numbers = re.findall(pdo_pattern, reference)
+        pdo_numbers = PDO_NUMBER.findall(reference)
+        if not pdo_numbers:
+            return None
+        
+        if sap_index is None:
+            sap_index = self._build_pdo_index(sap_data)
         
-        for pdo_num in pdo_numbers:
-            # Try direct match
-            for sheet_name, data in sap_data.items():
-                if data.pdo_number == pdo_num:
-                    return data
-                if pdo_num in sheet_name:
-                    return data
+        for pdo_num in map(sys.intern, pdo_numbers):
+            data = sap_index.get(pdo_num)
+            if data is not None:
+                return data
         
         return None
     
+    @staticmethod
+    def _build_pdo_index(sap_data: Dict[str, SAPPDOData]) -> Dict[str, SAPPDOData]:
+        """
+        Map every PDO number a sheet answers to -> SAPPDOData.
+        
+        A sheet answers to its pdo_number and to every 7-digit substring
+        of its name; the first sheet wins, so one lookup gives the same
+        result as scanning the sheets in order.
+        """
+        index: Dict[str, SAPPDOData] = {}
+        for sheet_name, data in sap_data.items():
+            index.setdefault(data.pdo_number, data)
+            for run in _DIGIT_RUN.findall(sheet_name):
+                for start in range(len(run) - _PDO_LENGTH + 1):
+                    index.setdefault(run[start:start + _PDO_LENGTH], data)
+        return index
+    
     def reconcile_batch(
         self,
         shipments: List[InboundShipment],
@@ -238,9 +284,15 @@ class ReconciliationEngine:
         Returns dictionary of reference -> ReconciliationResult
         """
         results = {}
+        if not shipments:
+            return results
+        
+        # One index for the whole batch; reconciliation stays serial since
+        # it is pure-Python work (threads would only contend on the GIL)
+        sap_index = self._build_pdo_index(sap_data)
         
         for shipment in shipments:
-            result = self.reconcile_inbound(shipment, sap_data)
+            result = self.reconcile_inbound(shipment, sap_data, sap_index=sap_index)
             results[shipment.reference] = result
         
         return results
@@ -250,32 +302,59 @@ class ReconciliationEngine:
         results: Dict[str, ReconciliationResult]
     ) -> str:
         """Generate a human-readable reconciliation report"""
-        lines = ["=" * 60]
-        lines.append("RECONCILIATION REPORT")
-        lines.append("=" * 60)
-        lines.append("")
+        return "".join(self.generate_report_stream(results)).removesuffix("\n")
+    
+    def generate_report_stream(
+        self,
+        results: Dict[str, ReconciliationResult]
+    ) -> Iterator[str]:
+        """
+        Yield the reconciliation report one newline-terminated line at a time.
+        
+        Lets large reports be written straight to a file or stdout
+        (e.g. file.writelines) instead of being built in memory first.
+        """
+        yield "=" * 60 + "\n"
+        yield "RECONCILIATION REPORT\n"
+        yield "=" * 60 + "\n"
+        yield "\n"
         
         total = len(results)
-        clean = sum(1 for r in results.values() if not r.has_issues)
-        with_warnings = sum(1 for r in results.values() if r.has_warnings and not r.has_errors)
-        with_errors = sum(1 for r in results.values() if r.has_errors)
+        clean = with_warnings = with_errors = 0
+        for r in results.values():
+            if not r.issues:
+                clean += 1
+                continue
+            error_count, warning_count = r.severity_counts()
+            if error_count:
+                with_errors += 1
+            elif warning_count:
+                with_warnings += 1
         
-        lines.append(f"Total Shipments: {total}")
-        lines.append(f"  ✅ Clean: {clean}")
-        lines.append(f"  🟡 Warnings: {with_warnings}")
-        lines.append(f"  🔴 Errors: {with_errors}")
-        lines.append("")
+        yield f"Total Shipments: {total}\n"
+        yield f"  ✅ Clean: {clean}\n"
+        yield f"  🟡 Warnings: {with_warnings}\n"
+        yield f"  🔴 Errors: {with_errors}\n"
+        yield "\n"
         
         # Detail issues
         for ref, result in results.items():
             if result.has_issues:
-                lines.append(f"\n{ref} ({result.get_summary()}):")
+                yield "\n"
+                yield f"{ref} ({result.get_summary()}):\n"
                 for issue in result.issues:
-                    icon = "🔴" if issue.severity == ValidationSeverity.ERROR else "🟡" if issue.severity == ValidationSeverity.WARNING else "ℹ️"
-                    lines.append(f"  {icon} {issue.field}: {issue.message}")
-                    lines.append(f"      💡 {issue.suggestion}")
-        
-        return "\n".join(lines)
+                    icon = _SEVERITY_ICON.get(issue.severity, "ℹ️")
+                    yield f"  {icon} {issue.field}: {issue.message}\n"
+                    yield f"      💡 {issue.suggestion}\n"
+
+
+# Fields copied from SAP per overwrite_mode ("merge" = SAP for financial
+# data, which is everything SAP holds; "document_wins" = nothing)
+_MERGE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "sap_wins": ("currency", "total_value", "brands", "country_splits"),
+    "merge": ("currency", "total_value", "brands", "country_splits"),
+    "document_wins": (),
+}
 
 
 def merge_sap_into_shipment(
@@ -297,30 +376,8 @@ def merge_sap_into_shipment(
     Returns:
         List of field names that were updated
     """
-    updated_fields = []
-    
-    if overwrite_mode == "sap_wins":
-        # SAP overwrites everything it has
-        shipment.currency = sap_data.currency
-        updated_fields.append('currency')
-        
-        shipment.total_value = sap_data.total_value
-        updated_fields.append('total_value')
-        
-        shipment.brands = sap_data.brands
-        updated_fields.append('brands')
-        
-        shipment.country_splits = sap_data.country_splits
-        updated_fields.append('country_splits')
-    
-    elif overwrite_mode == "merge":
-        # SAP for financial data only
-        shipment.currency = sap_data.currency
-        shipment.total_value = sap_data.total_value
-        shipment.brands = sap_data.brands
-        shipment.country_splits = sap_data.country_splits
-        updated_fields.extend(['currency', 'total_value', 'brands', 'country_splits'])
-    
-    # document_wins: Do nothing
+    fields = _MERGE_FIELDS.get(overwrite_mode, ())
+    for field_name in fields:
+        setattr(shipment, field_name, getattr(sap_data, field_name))
     
-    return updated_fields
+    return list(fields)
@@ -6,7 +6,8 @@ This prevents data loss on page refresh or accidental browser close.
 
 Design Decisions:
 1. Uses temp directory with session-specific ID
-2. Saves after each major operation (SAP parse, extraction, edit)
+2. Saves after each major operation (SAP parse, extraction, edit);
+   disk writes are debounced on a background thread and atomic
 3. Automatically loads on session start if state exists
 4. Cleans up on explicit user reset
 5. Thread-safe for concurrent writes
@@ -17,21 +18,66 @@ Future Considerations:
 """
 
 import json
-import pickle
 import tempfile
 import threading
+import time
+import atexit
+import weakref
 import os
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, Optional, List
-from dataclasses import dataclass, asdict
-import hashlib
+from typing import Dict, Any, Optional, List, Callable
+from dataclasses import dataclass, asdict, is_dataclass
+import secrets
 import logging
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+def _json_default(obj: Any) -> Any:
+    """orjson fallback for values orjson doesn't handle natively (e.g. sets)"""
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+# Per-type converter (the type's to_dict, else dataclasses.asdict), resolved once per type
+_TO_DICT_CACHE: Dict[type, Callable[[Any], Dict[str, Any]]] = {}
+
+# SAPPDOData fields persisted in snapshots
+_SAP_FIELDS = (
+    'pdo_number', 'brands', 'currency', 'total_value',
+    'country_splits', 'source_file', 'sheet_name'
+)
+
+
+def _to_dict(obj: Any) -> Dict[str, Any]:
+    """Convert a shipment to a dict using its type's to_dict when available"""
+    cls = type(obj)
+    convert = _TO_DICT_CACHE.get(cls)
+    if convert is None:
+        convert = cls.to_dict if hasattr(cls, 'to_dict') else asdict
+        _TO_DICT_CACHE[cls] = convert
+    return convert(obj)
+
+
+# Managers with possibly unwritten snapshots; held weakly so the exit hook
+# doesn't keep dropped managers alive
+_LIVE_MANAGERS: "weakref.WeakSet[StateManager]" = weakref.WeakSet()
+
+
+def _flush_live_managers():
+    """atexit hook: write any snapshot still waiting on the debounce delay"""
+    for manager in list(_LIVE_MANAGERS):
+        manager.flush()
+
+
+atexit.register(_flush_live_managers)
+
+
+@dataclass(slots=True)
 class StateSnapshot:
     """Serializable snapshot of pipeline state"""
     timestamp: str
@@ -55,10 +101,13 @@ class StateManager:
         recovered = manager.load_state()
     """
     
-    def __init__(self, session_id: Optional[str] = None):
+    def __init__(self, session_id: Optional[str] = None, write_delay_seconds: float = 0.5):
         """
         Initialize with optional session ID.
-        If not provided, generates one from timestamp.
+        If not provided, generates a random one.
+        
+        Snapshots saved within write_delay_seconds of each other are
+        coalesced into a single disk write.
         """
         self.session_id = session_id or self._generate_session_id()
         self._state_dir = Path(tempfile.gettempdir()) / "mgis_sessions"
@@ -68,21 +117,32 @@ class StateManager:
         # In-memory cache
         self._current_state: Optional[StateSnapshot] = None
         self._raw_responses: Dict[str, str] = {}  # filename -> raw response
+        
+        # Debounced background writer
+        self.write_delay_seconds = write_delay_seconds
+        self._pending_snapshot: Optional[StateSnapshot] = None
+        self._write_lock = threading.Lock()  # Serializes disk writes (newest wins)
+        self._writer: Optional[threading.Thread] = None  # Only alive while saves are pending
+        _LIVE_MANAGERS.add(self)
     
     def _generate_session_id(self) -> str:
-        """Generate a unique session ID"""
-        timestamp = datetime.now().isoformat()
-        return hashlib.md5(timestamp.encode()).hexdigest()[:12]
+        """Generate a unique session ID (12 random hex chars)"""
+        return secrets.token_hex(6)
     
     @property
     def state_file(self) -> Path:
         """Path to the state file"""
-        return self._state_dir / f"mgis_state_{self.session_id}.pkl"
+        return self._state_dir / f"mgis_state_{self.session_id}.json"
+    
+    @property
+    def meta_file(self) -> Path:
+        """Path to the small summary sidecar read by list_sessions"""
+        return self._state_dir / f"mgis_meta_{self.session_id}.json"
     
     @property
     def raw_responses_file(self) -> Path:
-        """Path to raw responses file (kept separate for size)"""
-        return self._state_dir / f"mgis_raw_{self.session_id}.json"
+        """Path to raw responses log (JSON Lines, kept separate for size)"""
+        return self._state_dir / f"mgis_raw_{self.session_id}.jsonl"
     
     def save_raw_response(self, document_id: str, raw_response: str):
         """
@@ -90,16 +150,45 @@ class StateManager:
         
         This is critical for debugging extraction issues.
         """
+        self.save_raw_responses_batch({document_id: raw_response})
+    
+    def save_raw_responses_batch(self, mapping: Dict[str, str]):
+        """
+        Save several raw AI responses under one lock and one file append.
+        
+        Use after a batch extraction instead of calling save_raw_response
+        per document.
+        """
+        if not mapping:
+            return
+        
+        lines = "".join(
+            json.dumps({"id": document_id, "response": raw_response}) + "\n"
+            for document_id, raw_response in mapping.items()
+        )
+        
         with self._lock:
-            self._raw_responses[document_id] = raw_response
+            self._raw_responses.update(mapping)
             
-            # Persist to disk
+            # Persist to disk (append-only; later lines win on load)
             try:
-                with open(self.raw_responses_file, 'w') as f:
-                    json.dump(self._raw_responses, f, indent=2)
+                with open(self.raw_responses_file, 'a') as f:
+                    f.write(lines)
             except Exception as e:
                 logger.warning(f"Failed to save raw responses: {e}")
     
+    def _read_raw_responses(self) -> Dict[str, str]:
+        """Rebuild the raw response dict from the JSON Lines log"""
+        responses: Dict[str, str] = {}
+        with open(self.raw_responses_file, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn final line from an interrupted append
+                responses[record["id"]] = record["response"]
+        return responses
+    
     def get_raw_response(self, document_id: str) -> Optional[str]:
         """Get raw AI response for a document"""
         return self._raw_responses.get(document_id)
@@ -124,72 +213,118 @@ class StateManager:
         - SAP files parsed
         - Each PDF processed
         - User edits saved
+        
+        Returns immediately; the snapshot is written by the background
+        writer (call flush() to force it to disk).
         """
         with self._lock:
             # Convert shipments to dicts if they're dataclasses
-            inbound_dicts = [
-                s.to_dict() if hasattr(s, 'to_dict') else asdict(s)
-                for s in inbound_shipments
-            ]
-            outbound_dicts = [
-                s.to_dict() if hasattr(s, 'to_dict') else asdict(s)
-                for s in outbound_shipments
-            ]
+            inbound_dicts = [_to_dict(s) for s in inbound_shipments]
+            outbound_dicts = [_to_dict(s) for s in outbound_shipments]
             
             # Convert SAP data
-            sap_dicts = {}
-            for key, data in sap_data.items():
-                if hasattr(data, '__dict__'):
-                    sap_dicts[key] = {
-                        'pdo_number': data.pdo_number,
-                        'brands': data.brands,
-                        'currency': data.currency,
-                        'total_value': data.total_value,
-                        'country_splits': data.country_splits,
-                        'source_file': data.source_file,
-                        'sheet_name': data.sheet_name
-                    }
-                else:
-                    sap_dicts[key] = data
+            sap_dicts = {
+                key: {name: getattr(data, name) for name in _SAP_FIELDS} if is_dataclass(data) else data
+                for key, data in sap_data.items()
+            }
             
             snapshot = StateSnapshot(
                 timestamp=datetime.now().isoformat(),
                 sap_data=sap_dicts,
                 inbound_shipments=inbound_dicts,
                 outbound_shipments=outbound_dicts,
-                raw_responses=self._raw_responses,
-                audit_entries=[asdict(e) if hasattr(e, '__dict__') else e for e in audit_entries],
+                raw_responses=dict(self._raw_responses),
+                audit_entries=[asdict(e) if is_dataclass(e) else e for e in audit_entries],
                 user_settings=user_settings,
                 processing_stage=processing_stage
             )
             
             self._current_state = snapshot
+            self._pending_snapshot = snapshot
+            
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._writer_loop,
+                    name=f"state-writer-{self.session_id}",
+                    daemon=True
+                )
+                self._writer.start()
+    
+    def _writer_loop(self):
+        """
+        Background thread: write the latest snapshot once saves settle.
+        
+        Exits as soon as nothing is pending; the next save_state starts a
+        new one, so idle managers hold no thread.
+        """
+        while True:
+            time.sleep(self.write_delay_seconds)  # Coalesce saves in this window
+            self._write_pending()
+            with self._lock:
+                if self._pending_snapshot is None:
+                    self._writer = None
+                    return
+    
+    def _write_pending(self):
+        """Atomically write the pending snapshot, if any"""
+        with self._write_lock:
+            with self._lock:
+                snapshot = self._pending_snapshot
+                self._pending_snapshot = None
+            if snapshot is None:
+                return
             
             try:
-                with open(self.state_file, 'wb') as f:
-                    pickle.dump(snapshot, f)
+                self._atomic_write(self.state_file, orjson.dumps(
+                    snapshot, default=_json_default, option=orjson.OPT_NON_STR_KEYS
+                ))
+                self._atomic_write(self.meta_file, orjson.dumps(self._summarize(snapshot)))
                 logger.info(f"State saved to {self.state_file}")
             except Exception as e:
                 logger.error(f"Failed to save state: {e}")
     
+    def _atomic_write(self, path: Path, data: bytes):
+        """Write via a temp file in the same directory + os.replace"""
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                dir=self._state_dir, prefix=f"{path.name}.", suffix=".tmp", delete=False
+            ) as f:
+                tmp_path = f.name
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    
+    def flush(self):
+        """Write any pending snapshot now (explicit sync point)"""
+        self._write_pending()
+    
+    def close(self):
+        """Flush and stop tracking this manager for the exit-time flush"""
+        self.flush()
+        _LIVE_MANAGERS.discard(self)
+    
     def load_state(self) -> Optional[StateSnapshot]:
         """
         Load state from disk if it exists.
         
         Returns None if no saved state.
         """
+        self.flush()
+        
         with self._lock:
             if not self.state_file.exists():
                 return None
             
             try:
-                with open(self.state_file, 'rb') as f:
-                    snapshot = pickle.load(f)
+                snapshot = StateSnapshot(**orjson.loads(self.state_file.read_bytes()))
                 
                 # Also load raw responses
                 if self.raw_responses_file.exists():
-                    with open(self.raw_responses_file, 'r') as f:
-                        self._raw_responses = json.load(f)
+                    self._raw_responses = self._read_raw_responses()
                 
                 self._current_state = snapshot
                 logger.info(f"State loaded from {self.state_file}")
@@ -201,37 +336,48 @@ class StateManager:
     
     def has_saved_state(self) -> bool:
         """Check if there's a saved state to recover"""
-        return self.state_file.exists()
+        return self._pending_snapshot is not None or self.state_file.exists()
     
     def clear_state(self):
         """Clear all saved state"""
-        with self._lock:
+        with self._write_lock, self._lock:
+            self._pending_snapshot = None
             self._current_state = None
             self._raw_responses = {}
             
             if self.state_file.exists():
                 self.state_file.unlink()
+            if self.meta_file.exists():
+                self.meta_file.unlink()
             if self.raw_responses_file.exists():
                 self.raw_responses_file.unlink()
             
             logger.info("State cleared")
     
+    @staticmethod
+    def _summarize(snapshot: StateSnapshot) -> Dict[str, Any]:
+        """Summary fields of a snapshot (also persisted as the meta sidecar)"""
+        return {
+            'timestamp': snapshot.timestamp,
+            'sap_pdos': len(snapshot.sap_data),
+            'inbound_count': len(snapshot.inbound_shipments),
+            'outbound_count': len(snapshot.outbound_shipments),
+            'processing_stage': snapshot.processing_stage,
+            'raw_responses_count': len(snapshot.raw_responses)
+        }
+    
     def get_state_summary(self) -> Dict[str, Any]:
         """Get summary of current state for UI display"""
         if self._current_state is None:
-            if not self.load_state():
-                return {'has_state': False}
+            # Read the meta sidecar rather than loading the full snapshot
+            self.flush()
+            try:
+                return {'has_state': True, **orjson.loads(self.meta_file.read_bytes())}
+            except Exception:
+                if not self.load_state():
+                    return {'has_state': False}
         
-        state = self._current_state
-        return {
-            'has_state': True,
-            'timestamp': state.timestamp,
-            'sap_pdos': len(state.sap_data),
-            'inbound_count': len(state.inbound_shipments),
-            'outbound_count': len(state.outbound_shipments),
-            'processing_stage': state.processing_stage,
-            'raw_responses_count': len(state.raw_responses)
-        }
+        return {'has_state': True, **self._summarize(self._current_state)}
     
     @classmethod
     def list_sessions(cls) -> List[Dict[str, Any]]:
@@ -240,16 +386,16 @@ class StateManager:
         if not state_dir.exists():
             return []
         
+        # Only the small meta sidecars are read, never the full snapshots
         sessions = []
-        for state_file in state_dir.glob("mgis_state_*.pkl"):
+        for meta_file in state_dir.glob("mgis_meta_*.json"):
             try:
-                with open(state_file, 'rb') as f:
-                    snapshot = pickle.load(f)
+                meta = orjson.loads(meta_file.read_bytes())
                 sessions.append({
-                    'session_id': state_file.stem.replace('mgis_state_', ''),
-                    'timestamp': snapshot.timestamp,
-                    'inbound_count': len(snapshot.inbound_shipments),
-                    'outbound_count': len(snapshot.outbound_shipments)
+                    'session_id': meta_file.stem.replace('mgis_meta_', ''),
+                    'timestamp': meta['timestamp'],
+                    'inbound_count': meta['inbound_count'],
+                    'outbound_count': meta['outbound_count']
                 })
             except Exception:
                 continue
@@ -265,11 +411,17 @@ class StateManager:
         
         cutoff = datetime.now().timestamp() - (max_age_hours * 3600)
         
-        for state_file in state_dir.glob("mgis_*.pkl"):
-            if state_file.stat().st_mtime < cutoff:
-                state_file.unlink()
-                logger.info(f"Cleaned up old session: {state_file}")
-        
-        for raw_file in state_dir.glob("mgis_raw_*.json"):
-            if raw_file.stat().st_mtime < cutoff:
-                raw_file.unlink()
+        # One directory read; DirEntry.stat() results are cached
+        with os.scandir(state_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                # .pkl: snapshots from before the JSON format, no longer loadable
+                if not name.startswith("mgis_") or not name.endswith((".json", ".jsonl", ".tmp", ".pkl")):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        if name.startswith("mgis_state_"):
+                            logger.info(f"Cleaned up old session: {entry.path}")
+                except FileNotFoundError:
+                    continue  # Removed concurrently
@@ -28,7 +28,8 @@ from models.shipment import (
 from config.settings import Settings, MappingSettings
 from utils.helpers import (
     normalize_tracking_number, normalize_awb_number,
-    extract_pdo_numbers, extract_itr_number, RateLimiter
+    extract_pdo_numbers, extract_itr_number, RateLimiter, TokenBucketRateLimiter,
+    AuditTrail
 )
 
 
@@ -63,10 +64,18 @@ class TestDateParsing:
     def test_iso_format(self):
         """Test ISO date format"""
         assert parse_date_flexible("2025-09-23") == date(2025, 9, 23)
+        assert parse_date_flexible("20250923") == date(2025, 9, 23)
+        assert parse_date_flexible("2025-09-23T10:30:00") == date(2025, 9, 23)
     
     def test_european_format(self):
         """Test DD/MM/YYYY format"""
         assert parse_date_flexible("23/09/2025") == date(2025, 9, 23)
+        assert parse_date_flexible("23-09-2025") == date(2025, 9, 23)
+    
+    def test_impossible_date(self):
+        """Test that well-shaped but impossible dates return None"""
+        assert parse_date_flexible("31/02/2025") is None
+        assert parse_date_flexible("2025-02-30") is None
     
     def test_invalid_date(self):
         """Test that invalid dates return None"""
@@ -265,6 +274,96 @@ class TestRateLimiter:
         assert stats['total_calls'] == 0
 
 
+class TestTokenBucketRateLimiter:
+    """Tests for the requests/tokens per minute limiter"""
+    
+    def test_burst_within_quota_no_wait(self):
+        limiter = TokenBucketRateLimiter(requests_per_minute=5)
+        waits = [limiter.wait() for _ in range(5)]
+        assert max(waits) < 0.1
+    
+    def test_waits_when_requests_exhausted(self):
+        limiter = TokenBucketRateLimiter(requests_per_minute=600)  # 1 per 0.1s
+        for _ in range(600):
+            limiter.wait()
+        assert limiter.wait() >= 0.05
+    
+    def test_waits_for_token_budget(self):
+        limiter = TokenBucketRateLimiter(requests_per_minute=0, tokens_per_minute=6000)  # 100/s
+        assert limiter.wait(tokens=6000) < 0.1
+        assert limiter.wait(tokens=10) >= 0.05
+    
+    def test_pause(self):
+        limiter = TokenBucketRateLimiter(requests_per_minute=60)
+        limiter.pause(0.1)
+        assert limiter.wait() >= 0.05
+        assert limiter.get_stats()['total_calls'] == 1
+
+
+class TestAuditTrail:
+    """Tests for audit trail storage and export"""
+    
+    def test_dataframe_columns(self):
+        audit = AuditTrail()
+        audit.log_extraction("PDO1", "page_1", "COURIER_LABEL")
+        df = audit.to_dataframe()
+        assert list(df.columns) == [
+            'timestamp', 'action', 'record_reference', 'field_name',
+            'old_value', 'new_value', 'source', 'notes'
+        ]
+        assert df.iloc[0]['record_reference'] == "PDO1"
+    
+    def test_ring_buffer_keeps_latest(self):
+        audit = AuditTrail(max_entries=2)
+        for ref in ("A", "B", "C"):
+            audit.log_export(ref, "Excel")
+        assert [e.record_reference for e in audit.entries] == ["B", "C"]
+        assert audit.dropped_count == 1
+    
+    def test_bulk_extractions(self):
+        audit = AuditTrail(max_entries=3)
+        audit.log_export("X", "Excel")
+        audit.log_extractions_bulk(
+            (pdo, "sap_data", "USD 1.00", "SAP") for pdo in ("1", "2", "3")
+        )
+        assert [e.record_reference for e in audit.entries] == ["1", "2", "3"]
+        assert all(e.action == "EXTRACTED" and e.source == "SAP" for e in audit.entries)
+        assert audit.dropped_count == 1
+
+    def test_log_many_shares_timestamp(self):
+        audit = AuditTrail()
+        audit.log_many(
+            ("EXPORTED", ref, None, None, "Excel", "SYSTEM", "") for ref in ("A", "B")
+        )
+        first, second = audit.entries
+        assert first.timestamp == second.timestamp
+        assert (second.action, second.record_reference, second.new_value) == ("EXPORTED", "B", "Excel")
+
+    def test_indexes_follow_eviction(self):
+        audit = AuditTrail(max_entries=3)
+        audit.log_user_edit("A", "mode", "AIR", "SEA")
+        audit.log_export("B", "Excel")
+        audit.log_user_edits_bulk("A", [("value", 1.0, 2.0), ("currency", "USD", "EUR")])
+        assert [e.field_name for e in audit.get_entries_for_record("A")] == ["value", "currency"]
+        assert [e.field_name for e in audit.get_user_edits()] == ["value", "currency"]
+        audit.clear()
+        assert audit.get_entries_for_record("B") == []
+
+    def test_bulk_helpers_match_single_calls(self):
+        single, bulk = AuditTrail(), AuditTrail()
+        single.log_validation("A", ["ERROR: missing value"])
+        single.log_export("A", "Excel")
+        single.log_export("B", "Excel")
+        bulk.log_validations_bulk([("A", ["ERROR: missing value"])])
+        bulk.log_exports_bulk(["A", "B"], "Excel")
+        
+        def strip_time(audit):
+            return [(e.action, e.record_reference, e.field_name, e.old_value, e.new_value, e.source, e.notes)
+                    for e in audit.entries]
+        
+        assert strip_time(bulk) == strip_time(single)
+
+
 # ============================================================================
 # Settings Tests
 # ============================================================================
@@ -391,6 +490,18 @@ class TestDocumentTypeEnum:
 # Product Classifier Tests
 # ============================================================================
 
+@pytest.fixture
+def fresh_classifier(monkeypatch):
+    """Swap in a fresh singleton classifier so tests can add rules without leaking them"""
+    from classifiers import product_classifier
+    
+    classifier = product_classifier.ProductClassifier()
+    monkeypatch.setattr(product_classifier, "_classifier_instance", classifier)
+    product_classifier.classify_description.cache_clear()
+    yield classifier
+    product_classifier.classify_description.cache_clear()
+
+
 class TestProductClassifier:
     """Tests for product classification"""
     
@@ -476,6 +587,15 @@ class TestProductClassifier:
         result = classify_description("MEDICAL DEVICES")
         assert result == "Medical Devices"
 
+    def test_memoized_result_invalidated_by_new_brand(self, fresh_classifier):
+        """Adding a brand should clear memoized classifications"""
+        from classifiers.product_classifier import classify_description
+        from classifiers.product_classifier import ProductCategory
+
+        assert classify_description("Zyqtest Ampoule") == "Unknown"
+        fresh_classifier.add_brand("Zyqtest", ProductCategory.ORAL_SUPPLEMENTS)
+        assert classify_description("Zyqtest Ampoule") == "Oral Supplements"
+
 
 class TestBrandCodeExtraction:
     """Tests for brand code extraction from Item No. patterns"""
@@ -532,6 +652,573 @@ class TestBrandCodeExtraction:
         assert result2.brand_codes == []
 
 
+# ============================================================================
+# Reconciliation Tests
+# ============================================================================
+
+class TestReconciliation:
+    """Tests for SAP reconciliation"""
+    
+    @pytest.mark.parametrize("sap_total", [-100.0, 0.0])
+    def test_non_positive_sap_total_not_flagged(self, sap_total):
+        """Credit notes (negative totals) and zero totals never raise VALUE_MISMATCH"""
+        from reconciliation import ReconciliationEngine, ReconciliationType
+        
+        sap = {"PDO 2500440": SAPPDOData("2500440", ["NST"], "USD", sap_total, {})}
+        shipment = InboundShipment(reference="PDO2500440", currency="USD", total_value=-100.0)
+        
+        result = ReconciliationEngine().reconcile_inbound(shipment, sap, auto_apply=False)
+        
+        assert result.matched_pdo is not None
+        assert not any(i.issue_type == ReconciliationType.VALUE_MISMATCH for i in result.issues)
+    
+    def test_value_outside_tolerance_flagged(self):
+        from reconciliation import ReconciliationEngine, ReconciliationType
+        
+        sap = {"PDO 2500440": SAPPDOData("2500440", ["NST"], "USD", 100.0, {})}
+        shipment = InboundShipment(reference="PDO2500440", currency="USD", total_value=94.0)
+        
+        result = ReconciliationEngine().reconcile_inbound(shipment, sap, auto_apply=False)
+        
+        assert [i.issue_type for i in result.issues] == [ReconciliationType.VALUE_MISMATCH]
+        assert "6.0%" in result.issues[0].message
+    
+    @pytest.mark.parametrize("reference, expected_pdo", [
+        # Earlier combined sheet names the PDO: sheet order wins over an exact pdo_number
+        ("PDO2500441", "2500440"),
+        ("PDO2500440", "2500440"),
+        ("PDO2500442", "2500442"),
+        ("PDO2500449", None),
+    ])
+    def test_first_matching_sheet_wins(self, reference, expected_pdo):
+        from reconciliation import ReconciliationEngine
+        
+        sap = {
+            "PDO 2500440 & 2500441": SAPPDOData("2500440", ["NST"], "EUR", 1.0, {}),
+            "PDO 2500441": SAPPDOData("2500441", ["NST"], "USD", 1.0, {}),
+            "Sheet3": SAPPDOData("2500442", ["HLC"], "USD", 1.0, {}),
+        }
+        engine = ReconciliationEngine()
+        
+        for index in (None, engine._build_pdo_index(sap)):
+            matched = engine._find_matching_sap(reference, sap, index)
+            assert (matched.pdo_number if matched else None) == expected_pdo
+    
+    def test_report_stream_matches_report(self):
+        from io import StringIO
+        from reconciliation import ReconciliationEngine
+        
+        engine = ReconciliationEngine()
+        sap = {"PDO 2500440": SAPPDOData("2500440", ["NST"], "USD", 100.0, {})}
+        results = {
+            "PDO2500440": engine.reconcile_inbound(
+                InboundShipment(reference="PDO2500440", currency="USD", total_value=94.0), sap, auto_apply=False
+            ),
+            "PDO9999999": engine.reconcile_inbound(
+                InboundShipment(reference="PDO9999999", currency="USD", total_value=1.0), sap, auto_apply=False
+            ),
+        }
+        
+        lines = list(engine.generate_report_stream(results))
+        out = StringIO()
+        out.writelines(lines)
+        
+        assert all(line.endswith("\n") and line.count("\n") == 1 for line in lines)
+        assert out.getvalue() == engine.generate_report(results) + "\n"
+
+
+# ============================================================================
+# State Manager Tests
+# ============================================================================
+
+@pytest.fixture
+def session_dir(tmp_path, monkeypatch):
+    """Point StateManager's temp directory at an isolated tmp_path"""
+    import tempfile
+    monkeypatch.setattr(tempfile, "gettempdir", lambda: str(tmp_path))
+    state_dir = tmp_path / "mgis_sessions"
+    state_dir.mkdir()
+    return state_dir
+
+
+class TestStateManager:
+    """Tests for session persistence"""
+    
+    def test_cleanup_removes_old_files_including_legacy_pickles(self, session_dir):
+        import os
+        import time
+        from state_manager import StateManager
+        
+        old = time.time() - 48 * 3600
+        stale = [
+            session_dir / "mgis_state_old.pkl",
+            session_dir / "mgis_state_old.json",
+            session_dir / "mgis_raw_old.jsonl",
+        ]
+        for path in stale:
+            path.write_text("x")
+            os.utime(path, (old, old))
+        fresh = session_dir / "mgis_state_new.json"
+        fresh.write_text("{}")
+        unrelated = session_dir / "notes.pkl"
+        unrelated.write_text("x")
+        os.utime(unrelated, (old, old))
+        
+        StateManager.cleanup_old_sessions(max_age_hours=24)
+        
+        assert not any(path.exists() for path in stale)
+        assert fresh.exists()
+        assert unrelated.exists()
+
+    def test_idle_manager_releases_writer_thread(self, session_dir):
+        import gc
+        import time
+        import weakref
+        from state_manager import StateManager
+        
+        manager = StateManager(session_id="idle", write_delay_seconds=0.01)
+        manager.save_state({}, [], [], [], {}, "sap_loaded")
+        for _ in range(200):
+            if manager._writer is None:
+                break
+            time.sleep(0.01)
+        
+        assert manager._writer is None
+        assert manager.state_file.exists()
+        ref = weakref.ref(manager)
+        del manager
+        gc.collect()
+        assert ref() is None
+    
+    def test_save_flush_load_round_trip(self, session_dir):
+        from state_manager import StateManager
+        
+        manager = StateManager(session_id="trip", write_delay_seconds=60)
+        manager.save_raw_response("PDO 2500444.pdf", '{"tracking": "884602373339"}')
+        manager.save_state(
+            {"PDO 2500444": SAPPDOData("2500444", ["NST"], "USD", 1000.0, {'SIN': 1000.0})},
+            [InboundShipment(reference="PDO2500444", etd_date=date(2025, 9, 23),
+                             mode=TransportMode.COURIER, brands=["NST"])],
+            [],
+            [],
+            {'period': "October-25"},
+            "extracted"
+        )
+        saved = manager._current_state
+        assert not manager.state_file.exists()  # Still waiting on the debounce delay
+        manager.flush()
+        
+        loaded = StateManager(session_id="trip").load_state()
+        
+        assert loaded == saved
+        assert loaded.inbound_shipments[0]['etd_date'] == "2025-09-23"
+        assert loaded.sap_data["PDO 2500444"]['country_splits'] == {'SIN': 1000.0}
+    
+    def test_raw_responses_rebuilt_from_log_skipping_torn_line(self, session_dir):
+        from state_manager import StateManager
+        
+        manager = StateManager(session_id="raw")
+        manager.save_raw_responses_batch({"a.pdf": "first", "b.pdf": "second"})
+        manager.save_raw_response("a.pdf", "retried")
+        manager.save_state({}, [], [], [], {}, "extracted")
+        manager.flush()
+        with open(manager.raw_responses_file, 'a') as f:
+            f.write('{"id": "c.pdf", "resp')  # Interrupted append
+        
+        recovered = StateManager(session_id="raw")
+        recovered.load_state()
+        
+        assert recovered.get_all_raw_responses() == {"a.pdf": "retried", "b.pdf": "second"}
+    
+    def test_meta_sidecar_backs_state_summary(self, session_dir):
+        import orjson
+        from state_manager import StateManager
+        
+        manager = StateManager(session_id="meta")
+        manager.save_raw_response("a.pdf", "raw")
+        manager.save_state(
+            {"PDO 2500444": SAPPDOData("2500444", ["NST"], "USD", 1.0, {})},
+            [InboundShipment(reference="PDO2500444"), InboundShipment(reference="PDO2500445")],
+            [],
+            [],
+            {},
+            "validated"
+        )
+        manager.flush()
+        
+        meta = orjson.loads(manager.meta_file.read_bytes())
+        summary = StateManager(session_id="meta").get_state_summary()
+        
+        assert {k: meta[k] for k in ('sap_pdos', 'inbound_count', 'outbound_count',
+                                     'processing_stage', 'raw_responses_count')} == {
+            'sap_pdos': 1, 'inbound_count': 2, 'outbound_count': 0,
+            'processing_stage': "validated", 'raw_responses_count': 1
+        }
+        assert summary == {'has_state': True, **meta}
+        assert StateManager(session_id="missing").get_state_summary() == {'has_state': False}
+    
+    def test_list_sessions_newest_first(self, session_dir):
+        import orjson
+        from state_manager import StateManager
+        
+        for session_id, timestamp in (("b", "2025-10-02T09:00:00"), ("a", "2025-10-01T09:00:00"),
+                                      ("c", "2025-10-03T09:00:00")):
+            (session_dir / f"mgis_meta_{session_id}.json").write_bytes(orjson.dumps({
+                'timestamp': timestamp, 'inbound_count': 1, 'outbound_count': 0
+            }))
+        (session_dir / "mgis_meta_broken.json").write_text("{")
+        
+        sessions = StateManager.list_sessions()
+        
+        assert [s['session_id'] for s in sessions] == ["c", "b", "a"]
+
+
+# ============================================================================
+# Vision Extractor Tests
+# ============================================================================
+
+class TestPDFProcessor:
+    """Tests for PDF page rendering"""
+    
+    def test_renders_from_worker_threads_hold_mupdf_lock(self, tmp_path, monkeypatch):
+        import fitz
+        from concurrent.futures import ThreadPoolExecutor
+        from extractors import vision_extractor
+        from extractors.vision_extractor import PDFProcessor
+        
+        pdf_path = str(tmp_path / "doc.pdf")
+        doc = fitz.open()
+        doc.new_page()
+        doc.save(pdf_path)
+        doc.close()
+        
+        lock_held = []
+        real_open = fitz.open
+        
+        def recording_open(*args, **kwargs):
+            lock_held.append(vision_extractor._MUPDF_LOCK.locked())
+            return real_open(*args, **kwargs)
+        
+        monkeypatch.setattr(vision_extractor.fitz, "open", recording_open)
+        processor = PDFProcessor(zoom_factor=0.5)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            images = list(pool.map(lambda _: processor.page_to_base64(pdf_path, 0), range(8)))
+        
+        assert len(set(images)) == 1
+        assert len(lock_held) == 8 and all(lock_held)
+
+
+class TestVisionExtractor:
+    """Tests for the Vision API wrapper"""
+    
+    def test_client_leaves_retries_to_send(self):
+        from extractors.vision_extractor import VisionExtractor
+        
+        settings = Settings()
+        settings.api.api_key = "test-key"
+        extractor = VisionExtractor(settings)
+        
+        assert extractor.client.max_retries == 0
+    
+    @pytest.mark.parametrize("status, retried", [(529, True), (500, True), (429, True), (400, False)])
+    def test_send_retries_transient_errors(self, status, retried):
+        import anthropic
+        import httpx
+        from types import SimpleNamespace
+        from extractors.vision_extractor import VisionExtractor
+        
+        settings = Settings()
+        settings.api.delay_seconds = 0
+        extractor = VisionExtractor(settings)
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        calls = []
+        
+        def create(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise anthropic.APIStatusError(
+                    "transient", response=httpx.Response(status, request=request), body=None
+                )
+            return SimpleNamespace(content=[SimpleNamespace(text='{"ok": true}')])
+        
+        extractor._client = SimpleNamespace(messages=SimpleNamespace(create=create))
+        
+        if retried:
+            assert extractor._send([{"type": "text", "text": "hi"}], 10, 0) == '{"ok": true}'
+            assert len(calls) == 2
+        else:
+            with pytest.raises(anthropic.APIStatusError):
+                extractor._send([{"type": "text", "text": "hi"}], 10, 0)
+            assert len(calls) == 1
+    
+    def test_send_retries_connection_errors(self):
+        import anthropic
+        import httpx
+        from types import SimpleNamespace
+        from extractors.vision_extractor import VisionExtractor
+        
+        settings = Settings()
+        settings.api.delay_seconds = 0
+        extractor = VisionExtractor(settings)
+        replies = iter([
+            anthropic.APIConnectionError(request=httpx.Request("POST", "https://api.anthropic.com")),
+            SimpleNamespace(content=[SimpleNamespace(text="done")]),
+        ])
+        
+        def create(**kwargs):
+            reply = next(replies)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+        
+        extractor._client = SimpleNamespace(messages=SimpleNamespace(create=create))
+        
+        assert extractor._send([{"type": "text", "text": "hi"}], 10, 0) == "done"
+    
+    @pytest.mark.parametrize("raw_response, expected", [
+        ('[{"document_type": "COURIER_LABEL"}, {"document_type": "INVOICE"}]',
+         [{"document_type": "COURIER_LABEL"}, {"document_type": "INVOICE"}]),
+        ('Here you go:\n[{"a": 1}, {"b": 2}]\nDone.', [{"a": 1}, {"b": 2}]),
+        ('[{"a": 1}]', None),                        # Missing page entry
+        ('[{"a": 1}, {"b": 2}, {"c": 3}]', None),    # Extra page entry
+        ('[{"a": 1}, "page 2"]', None),              # Entry that isn't an object
+        ('[{"a": 1}, {"b": 2},]', None),             # Malformed JSON
+        ('{"a": 1}', None),                          # No array at all
+    ])
+    def test_parse_batch_response(self, raw_response, expected):
+        from extractors.vision_extractor import VisionExtractor
+        
+        assert VisionExtractor._parse_batch_response(raw_response, 2) == expected
+    
+    def test_unusable_batch_reply_falls_back_to_per_page(self):
+        from extractors.vision_extractor import VisionExtractor
+        
+        extractor = VisionExtractor(Settings())
+        replies = iter([
+            '[{"document_type": "COURIER_LABEL"}, {"document_type": "PACKING_LIST"',  # Truncated
+            '{"document_type": "COURIER_LABEL", "confidence": "HIGH"}',
+            '{"document_type": "PACKING_LIST", "confidence": "LOW"}',
+        ])
+        extractor._send = lambda content, max_tokens, page_number: next(replies)
+        
+        results = extractor.extract_from_images_batch(["img0", "img1"], "inbound", [3, 4])
+        
+        assert [(r.page_number, r.document_type, r.confidence) for r in results] == [
+            (3, DocumentType.COURIER_LABEL, ExtractionConfidence.HIGH),
+            (4, DocumentType.PACKING_LIST, ExtractionConfidence.LOW),
+        ]
+    
+    def test_bad_batch_item_redone_individually(self):
+        from extractors.vision_extractor import VisionExtractor
+        
+        extractor = VisionExtractor(Settings())
+        sent_pages = []
+        replies = iter([
+            '[{"document_type": "COURIER_LABEL", "confidence": "HIGH"}, {"mode": 5}]',
+            '{"document_type": "PACKING_LIST", "confidence": "LOW"}',
+        ])
+        
+        def send(content, max_tokens, page_number):
+            sent_pages.append(page_number)
+            return next(replies)
+        
+        extractor._send = send
+        
+        results = extractor.extract_from_images_batch(["img0", "img1"], "inbound", [3, 4])
+        
+        assert sent_pages == [3, 4]  # The batch, then only the bad page
+        assert [(r.page_number, r.document_type) for r in results] == [
+            (3, DocumentType.COURIER_LABEL),
+            (4, DocumentType.PACKING_LIST),
+        ]
+
+
+# ============================================================================
+# Pipeline Tests
+# ============================================================================
+
+class TestInboundScheduling:
+    """Tests for inbound render/extract interleaving"""
+    
+    def test_renders_are_interleaved_with_progress(self):
+        from pipeline import ProcessingPipeline
+        
+        events = []
+        
+        class FakeProcessor:
+            def get_page_count(self, path):
+                return 2
+            
+            def pages_to_base64(self, path, pages):
+                events.append(("render", path))
+                return ["img"] * len(pages)
+        
+        class FakeExtractor:
+            def extract_from_images_batch(self, images, prompt_type="inbound", page_numbers=None):
+                return [
+                    ExtractionResult(
+                        document_type=DocumentType.COURIER_LABEL,
+                        confidence=ExtractionConfidence.HIGH,
+                        page_number=n
+                    )
+                    for n in page_numbers
+                ]
+        
+        settings = Settings()
+        settings.processing.progress_interval_seconds = 0
+        pipeline = ProcessingPipeline(settings)
+        pipeline.pdf_processor = FakeProcessor()
+        pipeline._get_extractor = lambda: FakeExtractor()
+        
+        files = [{'name': f"PDO 250044{i}.pdf", 'path': f"f{i}"} for i in range(5)]
+        pipeline.process_inbound_pdfs(files, lambda p: events.append(("progress", p.items_processed)))
+        
+        kinds = [kind for kind, _ in events]
+        assert kinds.index("progress") == 1  # Only the first file rendered up front
+        assert kinds.count("render") == 5
+        # Never more than max_concurrency files rendered ahead of consumption
+        window = settings.api.max_concurrency
+        rendered = done_pages = 0
+        for kind, value in events:
+            if kind == "render":
+                rendered += 1
+            else:
+                done_pages = value
+            assert rendered - done_pages // 2 <= window
+        assert len(pipeline.inbound_shipments) == 5
+
+
+class TestSAPParseCache:
+    """Tests for the shared parsed-SAP cache"""
+    
+    def test_cache_key_includes_country_mapping(self, monkeypatch):
+        import pipeline as pipeline_module
+        from collections import OrderedDict
+        from pipeline import ProcessingPipeline
+        
+        monkeypatch.setattr(pipeline_module, "_sap_cache", OrderedDict())
+        parses = []
+        
+        class FakeParser:
+            def __init__(self, mapping):
+                self.country_mapping = mapping
+            
+            def parse_file(self, file):
+                parses.append(dict(self.country_mapping))
+                return {"PDO 2500440": SAPPDOData("2500440", ["NST"], "USD", 1.0, {})}
+        
+        def parse(mapping):
+            pipeline = ProcessingPipeline(Settings())
+            pipeline.sap_parser = FakeParser(mapping)
+            return pipeline._parse_sap_file_cached(BytesIO(b"same workbook"), "sap.xlsx")
+        
+        parse({'SG': 'SIN'})
+        parse({'SG': 'SIN'})
+        parse({'SG': 'SIN', 'MY': 'MAL'})
+        
+        assert parses == [{'SG': 'SIN'}, {'SG': 'SIN', 'MY': 'MAL'}]
+
+
+class TestOutboundMatching:
+    """Tests for matching outbound invoices to AWBs by ITR/SOM reference"""
+    
+    @staticmethod
+    def _run_outbound(awb_names, invoice_names):
+        from pipeline import ProcessingPipeline
+        
+        class FakeProcessor:
+            def page_to_base64(self, path, page_num):
+                return path
+        
+        class FakeExtractor:
+            def specialize(self, prompt_type):
+                return lambda image, page_number=0: ExtractionResult(
+                    document_type=DocumentType.AIR_WAYBILL,
+                    confidence=ExtractionConfidence.HIGH
+                )
+        
+        settings = Settings()
+        settings.processing.progress_interval_seconds = 0
+        pipeline = ProcessingPipeline(settings)
+        pipeline.pdf_processor = FakeProcessor()
+        pipeline._get_extractor = lambda: FakeExtractor()
+        return pipeline.process_outbound_pdfs(
+            [{'name': name, 'path': name} for name in awb_names],
+            [{'name': name, 'path': name} for name in invoice_names]
+        )
+    
+    @pytest.mark.parametrize("invoice_name, awb_names, expected_awb", [
+        ("ITR 2502027_Invoice.pdf", ["ITR2502027_AWB.pdf"], "ITR2502027_AWB.pdf"),
+        ("itr2502027.pdf", ["AWB ITR 2502027.pdf"], "AWB ITR 2502027.pdf"),
+        ("SOM 2500101 Invoice.pdf", ["som2500101 AWB.pdf"], "som2500101 AWB.pdf"),
+        # Consolidated AWB covering several ITRs
+        ("ITR 2502101_Invoice.pdf", ["ITR 2502027 & ITR 2502101 AWB.pdf"], "ITR 2502027 & ITR 2502101 AWB.pdf"),
+        # First AWB in upload order wins
+        ("ITR 2502027_Invoice.pdf", ["ITR 2502027 a.pdf", "ITR 2502027 b.pdf"], "ITR 2502027 a.pdf"),
+        # Prefix and full number must both match
+        ("SOM 2502027_Invoice.pdf", ["ITR 2502027 AWB.pdf"], None),
+        ("ITR 250202_Invoice.pdf", ["ITR 2502027 AWB.pdf"], None),
+        ("Invoice.pdf", ["ITR 2502027 AWB.pdf"], None),
+    ])
+    def test_invoice_matched_to_awb_by_reference(self, invoice_name, awb_names, expected_awb):
+        shipments = self._run_outbound(awb_names, [invoice_name])
+        
+        invoice_shipment = next(s for s in shipments if s.invoice_file == invoice_name)
+        assert invoice_shipment.awb_file == expected_awb
+        # Unmatched AWBs still become AWB-only shipments
+        assert len(shipments) == 1 + len(awb_names) - (expected_awb is not None)
+
+
+class TestOutboundDescriptions:
+    """Tests for pulling product descriptions out of extractor notes"""
+    
+    @pytest.mark.parametrize("notes, expected", [
+        ("Carrier: SQ | Description: SKINCARE PRODUCTS | Pieces: 2", "SKINCARE PRODUCTS"),
+        ("Description:MEDICAL DEVICES", "MEDICAL DEVICES"),
+        ("Description: | Pieces: 2", ""),
+        ("Pieces: 2", None),
+        ("", None),
+        (None, None),
+    ])
+    def test_awb_description(self, notes, expected):
+        from pipeline import _extract_description, _AWB_DESCRIPTION_PATTERN
+        
+        assert _extract_description(notes, _AWB_DESCRIPTION_PATTERN) == expected
+    
+    @pytest.mark.parametrize("notes, expected", [
+        ("Invoice ITR 2502027. Description: Profhilo 2ml | Box 1", "Profhilo 2ml | Box 1"),
+        ("Description: Profhilo Syringe\nHaenkenium Cream\n", "Profhilo Syringe\nHaenkenium Cream"),
+        ("Totals only", None),
+        (None, None),
+    ])
+    def test_invoice_description(self, notes, expected):
+        from pipeline import _extract_description, _INVOICE_DESCRIPTION_PATTERN
+        
+        assert _extract_description(notes, _INVOICE_DESCRIPTION_PATTERN) == expected
+    
+    @pytest.mark.parametrize("awb_notes, invoice_notes, expected_category", [
+        ("Description: MEDICAL DEVICES | Pieces: 1", "Description: Moisturizing Cream", "Medical Devices"),
+        ("Pieces: 1", "Description: Moisturizing Cream", "Skincare Products"),
+        ("Description: | Pieces: 1", "Description: Moisturizing Cream", "Skincare Products"),
+        ("Pieces: 1", "No description", None),
+    ])
+    def test_invoice_description_is_fallback_for_awb(self, awb_notes, invoice_notes, expected_category):
+        from pipeline import ProcessingPipeline
+        
+        def result(notes):
+            return ExtractionResult(
+                document_type=DocumentType.AIR_WAYBILL,
+                confidence=ExtractionConfidence.HIGH,
+                notes=notes
+            )
+        
+        shipment = ProcessingPipeline(Settings())._create_outbound_shipment(
+            "ITR 2502027_Invoice.pdf", result(invoice_notes), result(awb_notes), "ITR 2502027_AWB.pdf"
+        )
+        
+        assert shipment.description == expected_category
+
+
 # ============================================================================
 # Run Tests
 # ============================================================================
@@ -2,18 +2,23 @@
 Utilities Module
 
 Contains:
-1. Rate limiter for API calls
+1. Rate limiters for API calls
 2. Audit trail management
 3. Common helper functions
 """
 
+import re
 import time
 import threading
+from collections import deque
+from operator import attrgetter
 from datetime import datetime
-from typing import List, Any, Optional, Dict
-from dataclasses import dataclass, field, asdict
+from typing import List, Any, Optional, Dict, Deque, Iterable, Set, Tuple, Union
+from dataclasses import dataclass, field, fields
 import logging
 
+from utils.patterns import ITR_REFERENCE
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -48,28 +53,40 @@ class RateLimiter:
         Returns the actual wait time in seconds.
         """
         with self._lock:
-            now = time.time()
+            now = time.monotonic()
             wait_time = 0.0
             
             if self.last_call_time is not None:
                 elapsed = now - self.last_call_time
                 if elapsed < self.min_delay:
                     wait_time = self.min_delay - elapsed
-                    logger.debug(f"Rate limiter waiting {wait_time:.1f}s")
+                    logger.debug("Rate limiter waiting %.1fs", wait_time)
                     time.sleep(wait_time)
             
-            self.last_call_time = time.time()
+            # sleep() returns no earlier than requested, so this is the call time
+            self.last_call_time = now + wait_time
             self._call_count += 1
             return wait_time
     
     def get_stats(self) -> Dict[str, Any]:
-        """Get rate limiter statistics"""
+        """
+        Get rate limiter statistics.
+        
+        last_call_time is a time.monotonic() reading (only meaningful
+        relative to other monotonic readings), not a wall-clock timestamp.
+        """
         return {
             'total_calls': self._call_count,
             'min_delay_seconds': self.min_delay,
             'last_call_time': self.last_call_time
         }
     
+    def pause(self, seconds: float) -> None:
+        """Hold back the next call by at least `seconds` (e.g. a 429 Retry-After)"""
+        with self._lock:
+            resume_at = time.monotonic() + seconds - self.min_delay
+            self.last_call_time = max(self.last_call_time or resume_at, resume_at)
+    
     def reset(self):
         """Reset the rate limiter state"""
         with self._lock:
@@ -77,7 +94,113 @@ class RateLimiter:
             self._call_count = 0
 
 
-@dataclass
+class TokenBucketRateLimiter:
+    """
+    Thread-safe dual token bucket for requests/minute and tokens/minute.
+    
+    Both buckets start full and refill continuously, so light requests
+    can burst up to the quota while heavy ones are held back until
+    enough token budget has accrued. A limit of 0 disables that bucket.
+    
+    Drop-in for RateLimiter: wait() blocks before each call and
+    returns the time spent waiting.
+    """
+    
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._call_count = 0
+        self._total_wait = 0.0
+    
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(
+                float(self.requests_per_minute),
+                self._requests + elapsed * self.requests_per_minute / 60
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                float(self.tokens_per_minute),
+                self._tokens + elapsed * self.tokens_per_minute / 60
+            )
+    
+    def wait(self, tokens: int = 0) -> float:
+        """
+        Block until one request costing `tokens` fits both buckets.
+        Returns the actual wait time in seconds.
+        """
+        with self._lock:
+            started = time.monotonic()
+            # A single request larger than the whole bucket waits for a full bucket
+            cost = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+            
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                delay = self._paused_until - now
+                if self.requests_per_minute and self._requests < 1:
+                    delay = max(delay, (1 - self._requests) * 60 / self.requests_per_minute)
+                if cost and self._tokens < cost:
+                    delay = max(delay, (cost - self._tokens) * 60 / self.tokens_per_minute)
+                if delay <= 0:
+                    break
+                logger.debug("Token bucket waiting %.1fs", delay)
+                time.sleep(delay)
+            
+            if self.requests_per_minute:
+                self._requests -= 1
+            self._tokens -= cost
+            self._call_count += 1
+            wait_time = time.monotonic() - started
+            self._total_wait += wait_time
+            return wait_time
+    
+    def pause(self, seconds: float) -> None:
+        """Hold back all calls for `seconds` (e.g. a 429 Retry-After)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get rate limiter statistics"""
+        return {
+            'total_calls': self._call_count,
+            'requests_per_minute': self.requests_per_minute,
+            'tokens_per_minute': self.tokens_per_minute,
+            'total_wait_seconds': self._total_wait
+        }
+    
+    def reset(self):
+        """Refill both buckets and clear statistics"""
+        with self._lock:
+            self._requests = float(self.requests_per_minute)
+            self._tokens = float(self.tokens_per_minute)
+            self._updated = time.monotonic()
+            self._paused_until = 0.0
+            self._call_count = 0
+            self._total_wait = 0.0
+
+
+def create_rate_limiter(api_settings) -> Union[RateLimiter, TokenBucketRateLimiter]:
+    """
+    Build the limiter described by APISettings: a token bucket when
+    requests_per_minute/tokens_per_minute are set, else fixed spacing.
+    """
+    if api_settings.requests_per_minute or api_settings.tokens_per_minute:
+        return TokenBucketRateLimiter(
+            api_settings.requests_per_minute,
+            api_settings.tokens_per_minute
+        )
+    return RateLimiter(api_settings.delay_seconds)
+
+
+@dataclass(slots=True)
 class AuditEntry:
     """Single audit log entry"""
     timestamp: datetime
@@ -90,69 +213,173 @@ class AuditEntry:
     notes: str = ""
 
 
+AUDIT_COLUMNS = tuple(f.name for f in fields(AuditEntry))
+_AUDIT_ROW = attrgetter(*AUDIT_COLUMNS)
+
+
 class AuditTrail:
     """
     Manages audit trail for all extraction and editing operations.
     
     Design Decision: In-memory for now, but structured to support
     persistence to database/file in the future.
+    
+    max_entries turns the trail into a ring buffer that keeps only the
+    most recent entries (None = keep everything, the default, since
+    the trail backs the exported audit log).
     """
     
-    def __init__(self):
-        self.entries: List[AuditEntry] = []
+    def __init__(self, max_entries: Optional[int] = None):
+        self.entries: Deque[AuditEntry] = deque(maxlen=max_entries)
+        self.dropped_count = 0
         self._lock = threading.Lock()
+        # Lookup indexes kept in step with self.entries (oldest first)
+        self._by_reference: Dict[str, Deque[AuditEntry]] = {}
+        self._user_edits: Deque[AuditEntry] = deque()
     
     def log(self, action: str, reference: str, field: Optional[str],
             old_value: Any, new_value: Any, source: str, notes: str = ""):
         """Add an audit entry"""
+        entry = AuditEntry(
+            timestamp=datetime.now(),
+            action=action,
+            record_reference=reference,
+            field_name=field,
+            old_value=old_value,
+            new_value=new_value,
+            source=source,
+            notes=notes
+        )
+        # The lock only covers the append: eviction accounting and the
+        # lookup indexes must change together with self.entries
         with self._lock:
-            entry = AuditEntry(
-                timestamp=datetime.now(),
-                action=action,
-                record_reference=reference,
-                field_name=field,
-                old_value=old_value,
-                new_value=new_value,
-                source=source,
-                notes=notes
-            )
+            self._note_dropped(1)
+            self._append((entry,))
+        logger.debug("Audit: %s on %s.%s: %s -> %s", action, reference, field, old_value, new_value)
+    
+    def _note_dropped(self, incoming: int):
+        """Account for entries a bounded trail is about to evict (caller holds the lock)"""
+        if self.entries.maxlen is None:
+            return
+        overflow = len(self.entries) + incoming - self.entries.maxlen
+        if overflow > 0:
+            if not self.dropped_count:
+                logger.warning("Audit trail full (%s entries); dropping oldest", self.entries.maxlen)
+            self.dropped_count += overflow
+    
+    def _append(self, entries: Iterable[AuditEntry]):
+        """Append entries and update the lookup indexes (caller holds the lock)"""
+        maxlen = self.entries.maxlen
+        for entry in entries:
+            if maxlen is not None and self.entries and len(self.entries) == maxlen:
+                self._unindex(self.entries[0])
             self.entries.append(entry)
-            logger.debug(f"Audit: {action} on {reference}.{field}: {old_value} -> {new_value}")
+            refs = self._by_reference.get(entry.record_reference)
+            if refs is None:
+                refs = self._by_reference[entry.record_reference] = deque()
+            refs.append(entry)
+            if entry.action == "USER_EDIT":
+                self._user_edits.append(entry)
+    
+    def _unindex(self, evicted: AuditEntry):
+        """Drop the oldest entry from the indexes as the ring buffer evicts it"""
+        refs = self._by_reference[evicted.record_reference]
+        refs.popleft()
+        if not refs:
+            del self._by_reference[evicted.record_reference]
+        if evicted.action == "USER_EDIT":
+            self._user_edits.popleft()
+    
+    def log_many(self, records: Iterable[Tuple[str, str, Optional[str], Any, Any, str, str]]):
+        """
+        Log many (action, reference, field, old_value, new_value, source, notes)
+        events under one lock, sharing a single timestamp.
+        """
+        timestamp = datetime.now()
+        entries = [AuditEntry(timestamp, *record) for record in records]
+        with self._lock:
+            self._note_dropped(len(entries))
+            self._append(entries)
     
     def log_extraction(self, reference: str, field: str, value: Any, source: str = "AI"):
         """Log an extraction event"""
         self.log("EXTRACTED", reference, field, None, value, source)
     
+    def log_extractions_bulk(self, records: Iterable[Tuple[str, str, Any, str]]):
+        """Log many (reference, field, value, source) extraction events under one lock"""
+        self.log_many(
+            ("EXTRACTED", reference, field, None, value, source, "")
+            for reference, field, value, source in records
+        )
+    
     def log_user_edit(self, reference: str, field: str, old_value: Any, new_value: Any):
         """Log a user edit"""
         self.log("USER_EDIT", reference, field, old_value, new_value, "USER")
     
+    def log_user_edits_bulk(self, reference: str, changes: Iterable[Tuple[str, Any, Any]]):
+        """Log several (field, old_value, new_value) user edits on one record under one lock"""
+        self.log_many(
+            ("USER_EDIT", reference, field, old_value, new_value, "USER", "")
+            for field, old_value, new_value in changes
+        )
+    
     def log_validation(self, reference: str, issues: List[str]):
         """Log validation results"""
         self.log("VALIDATED", reference, None, None, issues, "SYSTEM",
                 f"{len(issues)} issues found")
     
+    def log_validations_bulk(self, records: Iterable[Tuple[str, List[str]]]):
+        """Log many (reference, issues) validation results under one lock"""
+        self.log_many(
+            ("VALIDATED", reference, None, None, issues, "SYSTEM", f"{len(issues)} issues found")
+            for reference, issues in records
+        )
+    
     def log_export(self, reference: str, destination: str):
         """Log export event"""
         self.log("EXPORTED", reference, None, None, destination, "SYSTEM")
     
+    def log_exports_bulk(self, references: Iterable[str], destination: str):
+        """Log an export of many records to one destination under one lock"""
+        self.log_many(
+            ("EXPORTED", reference, None, None, destination, "SYSTEM", "")
+            for reference in references
+        )
+    
     def get_entries_for_record(self, reference: str) -> List[AuditEntry]:
         """Get all audit entries for a specific record"""
-        return [e for e in self.entries if e.record_reference == reference]
+        with self._lock:
+            return list(self._by_reference.get(reference, ()))
     
     def get_user_edits(self) -> List[AuditEntry]:
         """Get all user edits"""
-        return [e for e in self.entries if e.action == "USER_EDIT"]
+        with self._lock:
+            return list(self._user_edits)
     
     def to_dataframe(self):
         """Convert to pandas DataFrame for export"""
         import pandas as pd
-        return pd.DataFrame([asdict(e) for e in self.entries])
+        with self._lock:
+            records = list(map(_AUDIT_ROW, self.entries))
+        # Transpose to one list per column so pandas builds each column
+        # directly instead of inferring dtypes row by row
+        columns = zip(*records) if records else ((),) * len(AUDIT_COLUMNS)
+        return pd.DataFrame(
+            {name: list(values) for name, values in zip(AUDIT_COLUMNS, columns)},
+            columns=AUDIT_COLUMNS
+        )
     
     def clear(self):
         """Clear all entries"""
         with self._lock:
             self.entries.clear()
+            self._by_reference.clear()
+            self._user_edits.clear()
+            self.dropped_count = 0
+
+
+# Anything that isn't a letter or digit (str.isalnum equivalent)
+_NON_ALNUM_RE = re.compile(r'[\W_]+')
 
 
 def normalize_tracking_number(tracking: str) -> str:
@@ -165,7 +392,11 @@ def normalize_tracking_number(tracking: str) -> str:
     """
     if not tracking:
         return ""
-    return ''.join(c for c in tracking if c.isalnum())
+    return _NON_ALNUM_RE.sub('', tracking)
+
+
+# Already-normalized AWB (the format the extraction prompts ask for)
+_AWB_FORMATTED_RE = re.compile(r'\d{3}-\d{8}')
 
 
 def normalize_awb_number(awb: str) -> str:
@@ -180,8 +411,12 @@ def normalize_awb_number(awb: str) -> str:
     if not awb:
         return ""
     
+    # Fast path: already XXX-XXXXXXXX, nothing to filter or re-format
+    if _AWB_FORMATTED_RE.fullmatch(awb):
+        return awb
+    
     # Remove all non-alphanumeric
-    clean = ''.join(c for c in awb if c.isalnum())
+    clean = _NON_ALNUM_RE.sub('', awb)
     
     # If 11 digits, format as XXX-XXXXXXXX
     if len(clean) == 11 and clean.isdigit():
@@ -196,6 +431,12 @@ def normalize_awb_number(awb: str) -> str:
     return awb
 
 
+# PDO filename patterns (see extract_pdo_numbers)
+_PDO_RE = re.compile(r'PDO\s*(\d+)', re.IGNORECASE)
+_PARTIAL_RE = re.compile(r'(\d{7}),(\d{3}(?:,\d{3})*)')
+_AND_RE = re.compile(r'(\d{7})\s*[&,]\s*(\d{7})')
+
+
 def extract_pdo_numbers(text: str) -> List[str]:
     """
     Extract PDO numbers from a string.
@@ -205,33 +446,25 @@ def extract_pdo_numbers(text: str) -> List[str]:
         "PDO 2500430 & 2500432_dtd250926_IFC.pdf" -> ["2500430", "2500432"]
         "PDO2500437,439,440,441_dtd251003_NST.pdf" -> ["2500437", "2500439", "2500440", "2500441"]
     """
-    import re
-    
-    pdo_numbers = []
+    found: Set[str] = set()
     
     # Pattern 1: PDO followed by number
-    pattern1 = re.findall(r'PDO\s*(\d+)', text, re.IGNORECASE)
-    pdo_numbers.extend(pattern1)
+    found.update(_PDO_RE.findall(text))
     
     # Pattern 2: Numbers separated by comma (partial numbers)
     # e.g., "2500437,439,440,441" should give full numbers
-    partial_pattern = re.search(r'(\d{7}),(\d{3}(?:,\d{3})*)', text)
+    partial_pattern = _PARTIAL_RE.search(text)
     if partial_pattern:
-        base = partial_pattern.group(1)[:4]  # First 4 digits as base
-        pdo_numbers.append(partial_pattern.group(1))
-        for partial in partial_pattern.group(2).split(','):
-            full_num = base + partial
-            if full_num not in pdo_numbers:
-                pdo_numbers.append(full_num)
+        first = partial_pattern.group(1)
+        base = first[:4]  # First 4 digits as base
+        found.add(first)
+        found.update(base + partial for partial in partial_pattern.group(2).split(','))
     
     # Pattern 3: Numbers with & separator
-    and_pattern = re.findall(r'(\d{7})\s*[&,]\s*(\d{7})', text)
-    for match in and_pattern:
-        for num in match:
-            if num not in pdo_numbers:
-                pdo_numbers.append(num)
+    for match in _AND_RE.findall(text):
+        found.update(match)
     
-    return list(set(pdo_numbers))
+    return list(found)
 
 
 def extract_itr_number(text: str) -> Optional[str]:
@@ -242,10 +475,8 @@ def extract_itr_number(text: str) -> Optional[str]:
         "ITR 2502027_Invoice.pdf" -> "ITR 2502027"
         "ITR2502101" -> "ITR 2502101"
     """
-    import re
-    
     # Pattern: ITR or SOM followed by digits
-    match = re.search(r'(ITR|SOM)\s*(\d+)', text, re.IGNORECASE)
+    match = ITR_REFERENCE.search(text)
     if match:
         prefix = match.group(1).upper()
         number = match.group(2)
@@ -254,16 +485,20 @@ def extract_itr_number(text: str) -> Optional[str]:
     return None
 
 
+# Display formatters with thousands separator; IDR/VND have no minor unit
+_FORMAT_NO_DECIMALS = '{:,.0f}'.format
+_FORMAT_TWO_DECIMALS = '{:,.2f}'.format
+_CURRENCY_FORMATTERS = {
+    'IDR': _FORMAT_NO_DECIMALS,
+    'VND': _FORMAT_NO_DECIMALS,
+}
+
+
 def format_currency_value(value: float, currency: str) -> str:
     """Format a currency value for display"""
     if value is None:
         return ""
-    
-    # Format with thousands separator
-    if currency in ['IDR', 'VND']:
-        return f"{value:,.0f}"
-    else:
-        return f"{value:,.2f}"
+    return _CURRENCY_FORMATTERS.get(currency, _FORMAT_TWO_DECIMALS)(value)
 
 
 class FileValidator:
@@ -282,6 +517,10 @@ class FileValidator:
         'xls': b'\xd0\xcf\x11\xe0',  # OLE compound format
     }
     
+    # 4-byte header -> file kind, for a single dict lookup per validation
+    _MAGIC_LOOKUP = dict(zip(MAGIC_BYTES.values(), MAGIC_BYTES.keys()))
+    _EXCEL_KINDS = frozenset({'xlsx', 'xls'})
+    
     # Maximum file sizes (safety limits)
     MAX_SIZES = {
         'pdf': 100 * 1024 * 1024,   # 100 MB
@@ -289,6 +528,31 @@ class FileValidator:
         'xls': 50 * 1024 * 1024,    # 50 MB
     }
     
+    @staticmethod
+    def _probe(file_obj) -> Tuple[int, bytes]:
+        """
+        Return (size in bytes, 4-byte header) with as few stream calls as possible.
+        
+        In-memory buffers (BytesIO, Streamlit uploads) are read through
+        getbuffer() without any reads; other streams fall back to
+        seek/tell (fstat is not used since it misses unflushed writes).
+        The stream is left at the start.
+        """
+        try:
+            with file_obj.getbuffer() as buf:
+                size, header = buf.nbytes, bytes(buf[:4])
+            file_obj.seek(0)  # Reset
+            return size, header
+        except AttributeError:
+            pass
+        
+        file_obj.seek(0, 2)  # Seek to end
+        size = file_obj.tell()
+        file_obj.seek(0)  # Reset
+        header = file_obj.read(4)
+        file_obj.seek(0)  # Reset
+        return size, header
+    
     @classmethod
     def validate_pdf(cls, file_obj) -> tuple[bool, str]:
         """
@@ -297,11 +561,9 @@ class FileValidator:
         Returns (is_valid, error_message)
         """
         try:
-            # Check file size
-            file_obj.seek(0, 2)  # Seek to end
-            size = file_obj.tell()
-            file_obj.seek(0)  # Reset
+            size, header = cls._probe(file_obj)
             
+            # Check file size
             if size == 0:
                 return False, "File is empty"
             
@@ -309,10 +571,7 @@ class FileValidator:
                 return False, f"File too large ({size / 1024 / 1024:.1f} MB, max 100 MB)"
             
             # Check magic bytes
-            header = file_obj.read(4)
-            file_obj.seek(0)  # Reset
-            
-            if header != cls.MAGIC_BYTES['pdf']:
+            if cls._MAGIC_LOOKUP.get(header) != 'pdf':
                 return False, "File is not a valid PDF (invalid header)"
             
             return True, ""
@@ -328,11 +587,9 @@ class FileValidator:
         Returns (is_valid, error_message)
         """
         try:
-            # Check file size
-            file_obj.seek(0, 2)
-            size = file_obj.tell()
-            file_obj.seek(0)
+            size, header = cls._probe(file_obj)
             
+            # Check file size
             if size == 0:
                 return False, "File is empty"
             
@@ -340,15 +597,9 @@ class FileValidator:
                 return False, f"File too large ({size / 1024 / 1024:.1f} MB, max 50 MB)"
             
             # Check magic bytes (xlsx or xls)
-            header = file_obj.read(4)
-            file_obj.seek(0)
-            
-            if header == cls.MAGIC_BYTES['xlsx']:
-                return True, ""
-            elif header == cls.MAGIC_BYTES['xls']:
+            if cls._MAGIC_LOOKUP.get(header) in cls._EXCEL_KINDS:
                 return True, ""
-            else:
-                return False, "File is not a valid Excel file (invalid header)"
+            return False, "File is not a valid Excel file (invalid header)"
             
         except Exception as e:
             return False, f"Error validating file: {e}"
@@ -374,6 +625,33 @@ class FileValidator:
         return True, ""
 
 
+# Fallback country code -> name mapping (see country_code_to_name)
+_COUNTRY_CODE_TO_NAME: Dict[str, str] = {
+    'US': 'UNITED STATES',
+    'USA': 'UNITED STATES',
+    'UK': 'UNITED KINGDOM',
+    'GB': 'UNITED KINGDOM',
+    'SG': 'SINGAPORE',
+    'MY': 'MALAYSIA',
+    'VN': 'VIETNAM',
+    'ID': 'INDONESIA',
+    'PH': 'PHILIPPINES',
+    'KR': 'KOREA',
+    'JP': 'JAPAN',
+    'CN': 'CHINA',
+    'DE': 'GERMANY',
+    'FR': 'FRANCE',
+    'IT': 'ITALY',
+    'ES': 'SPAIN',
+    'NL': 'NETHERLANDS',
+    'CH': 'SWITZERLAND',
+    'AU': 'AUSTRALIA',
+    'CA': 'CANADA',
+    'IL': 'ISRAEL',
+    'BG': 'BULGARIA',
+}
+
+
 def country_code_to_name(code: str) -> str:
     """
     Convert country code to full name.
@@ -381,28 +659,5 @@ def country_code_to_name(code: str) -> str:
     Design Note: This is a fallback mapping. The authoritative mapping
     should come from Settings.
     """
-    mapping = {
-        'US': 'UNITED STATES',
-        'USA': 'UNITED STATES',
-        'UK': 'UNITED KINGDOM',
-        'GB': 'UNITED KINGDOM',
-        'SG': 'SINGAPORE',
-        'MY': 'MALAYSIA',
-        'VN': 'VIETNAM',
-        'ID': 'INDONESIA',
-        'PH': 'PHILIPPINES',
-        'KR': 'KOREA',
-        'JP': 'JAPAN',
-        'CN': 'CHINA',
-        'DE': 'GERMANY',
-        'FR': 'FRANCE',
-        'IT': 'ITALY',
-        'ES': 'SPAIN',
-        'NL': 'NETHERLANDS',
-        'CH': 'SWITZERLAND',
-        'AU': 'AUSTRALIA',
-        'CA': 'CANADA',
-        'IL': 'ISRAEL',
-        'BG': 'BULGARIA',
-    }
-    return mapping.get(code.upper(), code.upper())
+    code = code.upper()
+    return _COUNTRY_CODE_TO_NAME.get(code, code)
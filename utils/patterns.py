@@ -0,0 +1,15 @@
+"""
+Shared Regex Patterns
+
+Reference-number patterns used by more than one module, compiled once
+at import time. Module-specific patterns stay as module-level constants
+next to the code that uses them.
+"""
+
+import re
+
+# Bare 7-digit PDO number (e.g. in a shipment reference or SAP sheet name)
+PDO_NUMBER = re.compile(r'\d{7}')
+
+# ITR/SOM outbound reference: group 1 = prefix, group 2 = digits
+ITR_REFERENCE = re.compile(r'(ITR|SOM)\s*(\d+)', re.IGNORECASE)